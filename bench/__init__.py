@@ -0,0 +1,11 @@
+"""
+Воспроизводимые бенчмарки стадий пайплайна.
+
+    python -m bench.gen_corpus --out bench_data --os-lines 1000000 --c4-docs 50000
+    python -m bench.run --data bench_data --out bench_data/result.json
+    python -m bench.compare bench_data/result.json            # против bench/baseline.json
+    python -m bench.run --data bench_data --save-baseline     # обновить baseline
+    python -m bench.loadtest --store corpus/phrase_store      # QPS/латентность phrase_store
+
+Запускать из корня репозитория (скрипты пайплайна импортируются как модули).
+"""
@@ -0,0 +1,74 @@
+"""
+Сравнение результата bench.run с сохранённым baseline.
+
+    python -m bench.compare result.json [--baseline bench/baseline.json] [--threshold 5]
+
+Регрессия — падение lines/sec или рост пикового RSS больше чем на threshold %.
+С --fail-on-regression код выхода 1, если регрессии есть. Baseline не хранится в
+репозитории (он зависит от машины): сначала python -m bench.run --save-baseline.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from bench.run import BASELINE
+
+
+def _pct(new: float, old: float) -> float:
+    return (new - old) / old * 100.0 if old else 0.0
+
+
+def compare(base: dict, new: dict, threshold: float):
+    """Строки отчёта и число регрессий."""
+    rows = []
+    regressions = 0
+    for stage, res in new["stages"].items():
+        old = base["stages"].get(stage)
+        if old is None:
+            rows.append(f"{stage:12s} {res['lines_per_sec']:>12,.0f} lines/s   (no baseline)")
+            continue
+        d_speed = _pct(res["lines_per_sec"], old["lines_per_sec"])
+        d_rss = _pct(res["peak_rss_mb"], old["peak_rss_mb"])
+        flags = []
+        if d_speed < -threshold:
+            flags.append("SLOWER")
+        if d_rss > threshold:
+            flags.append("MORE MEMORY")
+        regressions += bool(flags)
+        rows.append(
+            f"{stage:12s} {old['lines_per_sec']:>12,.0f} -> {res['lines_per_sec']:>12,.0f} lines/s "
+            f"({d_speed:+6.1f}%)   RSS {old['peak_rss_mb']:8.1f} -> {res['peak_rss_mb']:8.1f} MB "
+            f"({d_rss:+6.1f}%)  {' '.join(flags)}"
+        )
+    return rows, regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="сравнить результат бенчмарка с baseline")
+    ap.add_argument("result", type=Path)
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--threshold", type=float, default=5.0, help="порог регрессии, %%")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    if not args.baseline.exists():
+        sys.exit(f"no baseline at {args.baseline}: run "
+                 f"`python -m bench.run --data <dir> --save-baseline` first")
+    base = json.loads(args.baseline.read_text(encoding="utf-8"))
+    new = json.loads(args.result.read_text(encoding="utf-8"))
+
+    if base["meta"].get("data") != new["meta"].get("data"):
+        print("[warn] baseline was measured on a different corpus")
+    print(f"baseline: {base['meta'].get('timestamp')} ({base['meta'].get('git')}), "
+          f"new: {new['meta'].get('timestamp')} ({new['meta'].get('git')})")
+
+    rows, regressions = compare(base, new, args.threshold)
+    print("\n".join(rows))
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
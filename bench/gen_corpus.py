@@ -0,0 +1,99 @@
+"""
+Генератор синтетического испанского корпуса с фиксированным seed.
+
+Словарь — псевдоиспанские слова из слогов, частоты по закону Ципфа.
+- opensubs_es.jsonl: короткие реплики (≈1–15 слов), ¿…? / ¡…! / точка, как в субтитрах;
+- c4_es_sample.jsonl: документы из нескольких предложений (≈30–400 слов).
+Формат записей совпадает с prepare_opensubs_jsonl.py и dump_c4_es.py.
+"""
+import argparse
+import itertools
+import random
+from pathlib import Path
+
+from codec import dumps_line
+
+SEED = 42
+VOCAB_SIZE = 50_000
+ZIPF_S = 1.07
+
+# реальные частотные слова идут первыми — на них срабатывают правила префильтра
+_HEAD = [
+    "de", "que", "no", "a", "la", "el", "y", "es", "en", "lo", "un", "por", "qué", "me",
+    "una", "te", "los", "se", "con", "para", "mi", "está", "si", "bien", "pero", "yo",
+    "eso", "las", "sí", "su", "tu", "aquí", "del", "al", "como", "le", "más", "esto",
+    "ya", "todo", "esta", "vamos", "muy", "hay", "ahora", "algo", "estoy", "tengo",
+    "nos", "tú", "nada", "cuando", "ha", "este", "sé", "estás", "así", "puedo", "quiero",
+    "mira", "creo", "sabes", "dime", "puedes", "hola", "señor", "gracias", "dónde",
+]
+_ONSETS = ["", "b", "c", "d", "f", "g", "l", "m", "n", "p", "r", "s", "t", "v", "ch", "ll",
+           "br", "tr", "pl", "gr", "qu", "ñ"]
+_VOWELS = ["a", "e", "i", "o", "u", "á", "é", "í", "ó", "ú", "ia", "ue", "io"]
+_CODAS = ["", "", "", "n", "s", "r", "l", "d"]
+
+
+def make_vocab(rng: random.Random, size: int = VOCAB_SIZE):
+    vocab = list(_HEAD)
+    seen = set(vocab)
+    while len(vocab) < size:
+        w = "".join(rng.choice(_ONSETS) + rng.choice(_VOWELS) + rng.choice(_CODAS)
+                    for _ in range(rng.randint(1, 4)))
+        if w not in seen:
+            seen.add(w)
+            vocab.append(w)
+    cum = list(itertools.accumulate(1.0 / (r + 1) ** ZIPF_S for r in range(size)))
+    return vocab, cum
+
+
+def _sentence(rng, vocab, cum, n_words: int) -> str:
+    words = rng.choices(vocab, cum_weights=cum, k=n_words)
+    s = " ".join(words)
+    s = s[0].upper() + s[1:]
+    r = rng.random()
+    if r < 0.2:
+        return "¿" + s + "?"
+    if r < 0.3:
+        return "¡" + s + "!"
+    if r < 0.4:
+        return s + ","
+    return s + "."
+
+
+def gen_opensubs(path: Path, n_lines: int, rng, vocab, cum):
+    with path.open("w", encoding="utf-8") as out:
+        for i in range(n_lines):
+            n = max(1, min(15, int(rng.lognormvariate(1.6, 0.6))))
+            out.write(dumps_line({"id": f"os_{i}", "source": "opensubs",
+                                  "text": _sentence(rng, vocab, cum, n)}))
+
+
+def gen_c4(path: Path, n_docs: int, rng, vocab, cum):
+    with path.open("w", encoding="utf-8") as out:
+        for _ in range(n_docs):
+            n_sent = max(2, int(rng.lognormvariate(2.0, 0.6)))
+            text = " ".join(_sentence(rng, vocab, cum, rng.randint(6, 30)) for _ in range(n_sent))
+            out.write(dumps_line({"source": "c4_es", "text": text[:2000]}))
+
+
+def generate(out_dir: Path, os_lines: int, c4_docs: int, seed: int = SEED):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    vocab, cum = make_vocab(rng)
+    gen_opensubs(out_dir / "opensubs_es.jsonl", os_lines, rng, vocab, cum)
+    gen_c4(out_dir / "c4_es_sample.jsonl", c4_docs, rng, vocab, cum)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="синтетический испанский корпус для бенчмарков")
+    ap.add_argument("--out", type=Path, default=Path("bench_data"))
+    ap.add_argument("--os-lines", type=int, default=1_000_000)
+    ap.add_argument("--c4-docs", type=int, default=50_000)
+    ap.add_argument("--seed", type=int, default=SEED)
+    args = ap.parse_args()
+
+    generate(args.out, args.os_lines, args.c4_docs, args.seed)
+    print("Corpus written to:", args.out.resolve())
+
+
+if __name__ == "__main__":
+    main()
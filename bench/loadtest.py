@@ -0,0 +1,134 @@
+"""
+Нагрузочный тест phrase_store.
+
+Запросы генерируются из самого хранилища: случайные фразы (exact), их обрезанные
+префиксы (prefix) и слова из них (word). Без --url запросы идут прямо в
+PhraseStore в этом процессе (чистая латентность структуры), с --url — в HTTP-сервер
+(python phrase_store.py serve) из --threads потоков с keep-alive соединениями.
+
+    python -m bench.loadtest --store corpus/phrase_store --duration 10
+    python -m bench.loadtest --store corpus/phrase_store --url http://127.0.0.1:8080 --threads 8
+
+Печатает QPS и перцентили латентности по типам запросов; --out — то же в JSON.
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+KINDS = ["prefix", "exact", "word"]
+QUERY_POOL = 10_000
+
+
+def make_queries(store, n: int, seed: int):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        key = store.keys[rng.randrange(len(store))].decode("utf-8")
+        kind = rng.choice(KINDS)
+        if kind == "prefix":
+            q = key[:rng.randint(2, max(2, len(key)))]
+        elif kind == "word":
+            q = rng.choice(key.split(" "))
+        else:
+            q = key
+        queries.append((kind, q))
+    return queries
+
+
+def _percentiles(values) -> dict:
+    s = sorted(values)
+    if not s:
+        return {}
+
+    def q(p):
+        return round(s[min(len(s) - 1, int(p * len(s)))] * 1e3, 3)
+
+    return {"count": len(s), "p50_ms": q(0.50), "p90_ms": q(0.90), "p99_ms": q(0.99),
+            "max_ms": round(s[-1] * 1e3, 3)}
+
+
+def _worker(queries, deadline, k, url, out):
+    rng = random.Random(threading.get_ident())
+    conn = None
+    store = None
+    if url is None:
+        store = out["store"]
+    else:
+        u = urlsplit(url)
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80)
+
+    lat = {kind: [] for kind in KINDS}
+    while time.perf_counter() < deadline:
+        kind, q = queries[rng.randrange(len(queries))]
+        t0 = time.perf_counter()
+        if store is not None:
+            store.query(kind, q, k)
+        else:
+            conn.request("GET", f"/{kind}?q={quote(q)}&k={k}")
+            resp = conn.getresponse()
+            resp.read()
+        lat[kind].append(time.perf_counter() - t0)
+
+    if conn is not None:
+        conn.close()
+    with out["lock"]:
+        for kind, values in lat.items():
+            out["lat"][kind].extend(values)
+
+
+def main():
+    from phrase_store import STORE_DIR, TOP_K, PhraseStore
+
+    ap = argparse.ArgumentParser(description="phrase_store load test")
+    ap.add_argument("--store", type=Path, default=STORE_DIR)
+    ap.add_argument("--url", default=None, help="HTTP-сервер; без него — запросы в процессе")
+    ap.add_argument("--threads", type=int, default=1)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("-k", type=int, default=TOP_K)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", type=Path, default=None)
+    args = ap.parse_args()
+
+    store = PhraseStore(args.store)
+    queries = make_queries(store, QUERY_POOL, args.seed)
+    print(f"{len(store)} phrases, {len(queries)} queries, "
+          f"{args.threads} thread(s), {'HTTP ' + args.url if args.url else 'in-process'}")
+
+    shared = {"store": store, "lock": threading.Lock(), "lat": {kind: [] for kind in KINDS}}
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=_worker, args=(queries, deadline, args.k, args.url, shared))
+               for _ in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    total = sum(len(v) for v in shared["lat"].values())
+    result = {
+        "mode": args.url or "in-process",
+        "threads": args.threads,
+        "seconds": round(elapsed, 2),
+        "queries": total,
+        "qps": round(total / elapsed, 1),
+        "latency": {kind: _percentiles(v) for kind, v in shared["lat"].items()},
+        "all": _percentiles([x for v in shared["lat"].values() for x in v]),
+    }
+
+    print(f"QPS: {result['qps']} ({total} queries in {result['seconds']}s)")
+    for kind, p in list(result["latency"].items()) + [("all", result["all"])]:
+        if p:
+            print(f"  {kind:<7} p50 {p['p50_ms']:.3f} ms  p90 {p['p90_ms']:.3f} ms  "
+                  f"p99 {p['p99_ms']:.3f} ms  max {p['max_ms']:.3f} ms")
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=1), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
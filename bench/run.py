@@ -0,0 +1,255 @@
+"""
+Бенчмарки стадий на синтетическом корпусе (см. bench.gen_corpus).
+
+Каждая стадия идёт в отдельном (spawn) процессе: подготовка входов не
+замеряется, замеряется только целевая функция. Для каждой стадии пишется
+lines/sec и пиковый прирост RSS за время самой стадии (peak_rss_mb; на Linux пик
+сбрасывается через /proc/self/clear_refs после подготовки, иначе — ru_maxrss процесса,
+peak_includes_setup = true).
+
+merge и build_index берут входы из count, prefilter — из build_index (REQUIRES):
+такие стадии нужно запускать вместе с поставщиком или после него на том же --data.
+
+- count        — count_ngrams_external.process() на смеси OS + C4
+- count_topk   — count_ngrams_external.process_topk()
+- merge        — multiway_merge_sorted() на MERGE_RUNS отсортированных прогонах
+- build_index  — build_phrase_index.process_ngrams() по freq-файлам из count
+- prefilter    — prefilter_phrases.simple_prefilter() по записям из build_index
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+from pathlib import Path
+from queue import Empty
+
+STAGES = ["count", "count_topk", "merge", "build_index", "prefilter"]
+# стадия -> (стадия, которая готовит её входы, сами входы в work/)
+REQUIRES = {
+    "merge": ("count", ["freq_ngrams_2_4.jsonl"]),
+    "build_index": ("count", ["freq_unigrams.jsonl", "freq_ngrams_2_4.jsonl", "freq_ngrams_5.jsonl"]),
+    "prefilter": ("build_index", ["phrase_index.jsonl"]),
+}
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+MERGE_RUNS = 16
+
+
+def _count_lines(path: Path) -> int:
+    with path.open("rb") as f:
+        return sum(buf.count(b"\n") for buf in iter(lambda: f.read(1 << 20), b""))
+
+
+def _prepare_mix(data: Path, work: Path) -> Path:
+    mix = work / "mix.jsonl"
+    if not mix.exists():
+        with mix.open("wb") as out:
+            for name in ("opensubs_es.jsonl", "c4_es_sample.jsonl"):
+                with (data / name).open("rb") as inp:
+                    shutil.copyfileobj(inp, out)
+    return mix
+
+
+def _setup_counter(data: Path, work: Path):
+    import count_ngrams_external as c
+    c.INPUT_JSONL = _prepare_mix(data, work)
+    c.OUTPUT_UNI = work / "freq_unigrams.jsonl"
+    c.OUTPUT_NGRAMS_2_4 = work / "freq_ngrams_2_4.jsonl"
+    c.OUTPUT_NGRAMS_5 = work / "freq_ngrams_5.jsonl"
+    return c
+
+
+# Каждая stage_* готовит входы и возвращает (число строк, замеряемая функция).
+
+def stage_count(data: Path, work: Path):
+    c = _setup_counter(data, work)
+    return _count_lines(c.INPUT_JSONL), c.process
+
+
+def stage_count_topk(data: Path, work: Path):
+    c = _setup_counter(data, work)
+    topk_dir = work / "topk"
+    topk_dir.mkdir(exist_ok=True)
+    c.OUTPUT_UNI = topk_dir / "freq_unigrams.jsonl"
+    c.OUTPUT_NGRAMS_2_4 = topk_dir / "freq_ngrams_2_4.jsonl"
+    c.OUTPUT_NGRAMS_5 = topk_dir / "freq_ngrams_5.jsonl"
+    return _count_lines(c.INPUT_JSONL), c.process_topk
+
+
+def stage_merge(data: Path, work: Path):
+    import count_ngrams_external as c
+    src = work / "freq_ngrams_2_4.jsonl"
+    runs_dir = work / "runs"
+    runs_dir.mkdir(exist_ok=True)
+    runs = [runs_dir / f"run_{i:03d}.jsonl" for i in range(MERGE_RUNS)]
+
+    # round-robin подмножества отсортированного файла тоже отсортированы
+    outs = [r.open("w", encoding="utf-8") for r in runs]
+    lines = 0
+    with src.open("r", encoding="utf-8") as inp:
+        for lines, line in enumerate(inp, 1):
+            outs[lines % MERGE_RUNS].write(line)
+    for o in outs:
+        o.close()
+
+    return lines, lambda: c.multiway_merge_sorted([str(r) for r in runs], work / "merged.jsonl")
+
+
+def stage_build_index(data: Path, work: Path):
+    import build_phrase_index as b
+    b.UNIGRAMS = work / "freq_unigrams.jsonl"
+    freq_word = b.load_unigrams()
+    paths = [work / "freq_ngrams_2_4.jsonl", work / "freq_ngrams_5.jsonl"]
+
+    def run():
+        with (work / "phrase_index.jsonl").open("w", encoding="utf-8") as out:
+            for p in paths:
+                b.process_ngrams(p, freq_word, out)
+
+    return sum(_count_lines(p) for p in paths), run
+
+
+def stage_prefilter(data: Path, work: Path):
+    from codec import loads
+    from prefilter_phrases import simple_prefilter
+    with (work / "phrase_index.jsonl").open("r", encoding="utf-8") as inp:
+        recs = [loads(line) for line in inp]
+
+    def run():
+        for rec in recs:
+            simple_prefilter(rec)
+
+    return len(recs), run
+
+
+def _status_kb(field: str):
+    """Поле VmRSS/VmHWM из /proc/self/status в КБ (None — не Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """Сбросить VmHWM к текущему RSS (Linux, /proc/self/clear_refs)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _child(stage: str, data: str, work: str, queue):
+    sys.path.insert(0, os.getcwd())
+    try:
+        with open(os.devnull, "w") as devnull, \
+                contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            lines, fn = globals()[f"stage_{stage}"](Path(data), Path(work))
+            # пик памяти — только за время самой стадии, без подготовки входов
+            exact = _reset_peak_rss()
+            setup_kb = _status_kb("VmRSS") or 0
+            t0 = time.perf_counter()
+            fn()
+            seconds = time.perf_counter() - t0
+    except Exception:
+        queue.put({"error": traceback.format_exc()})
+        raise
+    if exact:
+        peak_kb = (_status_kb("VmHWM") or 0) - setup_kb
+    else:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({"lines": lines, "seconds": seconds, "peak_rss_mb": peak_kb / 1024,
+               "setup_rss_mb": setup_kb / 1024, "peak_includes_setup": not exact})
+
+
+def run_stage(stage: str, data: Path, work: Path) -> dict:
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(stage, str(data), str(work), queue))
+    proc.start()
+    proc.join()
+    try:
+        res = queue.get(timeout=1)
+    except Empty:
+        res = {}
+    if proc.exitcode != 0 or "error" in res:
+        raise RuntimeError(f"stage {stage} failed with exit code {proc.exitcode}\n"
+                           + res.get("error", ""))
+    res["lines_per_sec"] = res["lines"] / res["seconds"] if res["seconds"] else 0.0
+    return res
+
+
+def _meta(data: Path) -> dict:
+    import codec
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "git": rev,
+        "python": platform.python_version(),
+        "codec": codec.BACKEND,
+        "data": {p.name: p.stat().st_size for p in sorted(data.glob("*.jsonl"))},
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="бенчмарки стадий пайплайна")
+    ap.add_argument("--data", type=Path, default=Path("bench_data"),
+                    help="каталог с корпусом из bench.gen_corpus")
+    ap.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    ap.add_argument("--repeat", type=int, default=1, help="лучший из N прогонов")
+    ap.add_argument("--out", type=Path, help="куда записать результат (json)")
+    ap.add_argument("--save-baseline", action="store_true", help=f"записать результат в {BASELINE}")
+    args = ap.parse_args()
+
+    work = args.data / "work"
+    work.mkdir(parents=True, exist_ok=True)
+
+    stages = [s for s in STAGES if s in args.stages]
+    for stage in stages:
+        if stage not in REQUIRES:
+            continue
+        dep, inputs = REQUIRES[stage]
+        missing = [name for name in inputs if not (work / name).exists()]
+        if missing and dep not in stages:
+            ap.error(f"stage {stage} needs {', '.join(missing)} from stage {dep}: "
+                     f"add {dep} to --stages")
+
+    results = {}
+    for stage in stages:
+        best = None
+        for _ in range(args.repeat):
+            res = run_stage(stage, args.data, work)
+            if best is None or res["seconds"] < best["seconds"]:
+                best = res
+        results[stage] = best
+        print(f"{stage:12s} {best['lines']:>10d} lines  {best['seconds']:8.2f}s  "
+              f"{best['lines_per_sec']:>12,.0f} lines/s  peak RSS {best['peak_rss_mb']:8.1f} MB")
+
+    report = {"meta": _meta(args.data), "stages": results}
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    if args.save_baseline:
+        BASELINE.write_text(text, encoding="utf-8")
+        print("Baseline saved to:", BASELINE)
+
+
+if __name__ == "__main__":
+    main()
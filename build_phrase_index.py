@@ -1,8 +1,18 @@
-import json
+import multiprocessing as mp
+import os
 from pathlib import Path
 from math import log
 from tqdm import tqdm
 
+import line_index
+import metrics
+import profiling
+import shards
+from codec import dumps_line
+from corpus_io import open_text
+from es_tokenizer import tokenize
+from prefetch import PrefetchReader, decode_counts
+
 UNIGRAMS = Path("corpus/jsonl/freq_unigrams.jsonl")
 NGRAMS_2_4 = Path("corpus/jsonl/freq_ngrams_2_4.jsonl")
 NGRAMS_5 = Path("corpus/jsonl/freq_ngrams_5.jsonl")
@@ -12,32 +22,71 @@ PHRASE_INDEX = Path("corpus/jsonl/phrase_index.jsonl")
 F_MIN = 5        # минимальная частота фразы, чтобы вообще учитывать
 MAX_PHRASES = None  # можно ограничить top-N, если захочешь
 
+# Слитый режим: сразу прогонять записи через simple_prefilter из prefilter_phrases.py
+# и писать только выжившие в его PHRASE_INDEX_OUT, без промежуточного phrase_index.jsonl
+FUSED_PREFILTER = False
+
+# Шардированные входы (манифест от count_ngrams_external с SHARDS > 1) обрабатываются
+# в пуле, каждый шард — в свой шард индекса
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
 
 def load_unigrams():
     freq = {}
-    with UNIGRAMS.open("r", encoding="utf-8") as f:
-        for line in tqdm(f, desc="loading unigrams"):
-            obj = json.loads(line)
-            w = obj["text"]
-            c = obj["count"]
-            freq[w] = c
+    for part in shards.parts(UNIGRAMS):
+        with PrefetchReader(part, decode_counts) as reader:
+            for batch in tqdm(reader, desc=f"loading {part.name}", unit=" blocks"):
+                freq.update(batch)
     return freq
 
 
-def process_ngrams(ngram_path, freq_word, out):
-    with ngram_path.open("r", encoding="utf-8") as f:
-        for line in tqdm(f, desc=f"processing {ngram_path.name}"):
-            obj = json.loads(line)
-            phrase = obj["text"]
-            freq_phrase = obj["count"]
+def _records(reader, bar):
+    """(phrase, freq) из фонового ридера с учётом прогресса и метрик."""
+    for batch in reader:
+        metrics.inc("records_in", len(batch))
+        bar.update(len(batch))
+        yield from batch
+
+
+def iter_index_records(ngram_path, freq_word, prefilter=None, stats=None):
+    """
+    Генератор записей индекса из файла n-грамм.
+
+    prefilter(rec) -> bool вызывается на «дешёвой» записи (phrase, freq_phrase, n)
+    и может переписать rec["phrase"]; tokens / word_freqs / word_importance
+    считаются только для прошедших (по исходной фразе — как в раздельном прогоне).
+    stats (dict) — счётчики "total" / "kept".
+    """
+    with PrefetchReader(ngram_path, decode_counts) as reader, \
+            tqdm(desc=f"processing {ngram_path.name}", unit=" lines") as bar:
+        for phrase, freq_phrase in _records(reader, bar):
             if freq_phrase < F_MIN:
                 continue
 
-            tokens = phrase.split()
-            n = len(tokens)
+            if prefilter is None:
+                tokens = tokenize(phrase)
+                n = len(tokens)
+            else:
+                # n-граммы из счётчика — токены через один пробел
+                tokens = None
+                n = phrase.count(" ") + 1
             if n < 2 or n > 5:
                 continue
 
+            rec = {
+                "phrase": phrase,
+                "freq_phrase": freq_phrase,
+                "n": n,
+            }
+            if stats is not None:
+                stats["total"] = stats.get("total", 0) + 1
+            if prefilter is not None:
+                if not prefilter(rec):
+                    continue
+                tokens = tokenize(phrase)
+            if stats is not None:
+                stats["kept"] = stats.get("kept", 0) + 1
+
             wf = []
             w_imp = 0.0
             for w in tokens:
@@ -45,27 +94,127 @@ def process_ngrams(ngram_path, freq_word, out):
                 wf.append(fw)
                 w_imp += log(fw + 1.0)
 
-            rec = {
-                "phrase": phrase,
-                "freq_phrase": freq_phrase,
-                "n": n,
-                "tokens": tokens,
-                "word_freqs": wf,
-                "word_importance": w_imp,
-            }
-            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            rec["tokens"] = tokens
+            rec["word_freqs"] = wf
+            rec["word_importance"] = w_imp
+            metrics.inc("records_out")
+            yield rec
+
+
+def process_ngrams(ngram_path, freq_word, out):
+    for rec in iter_index_records(ngram_path, freq_word):
+        out.write(dumps_line(rec))
+
+
+def process_fused(freq_word):
+    """build_index -> prefilter одним потоком: на диск пишутся только выжившие записи."""
+    from prefilter_phrases import PHRASE_INDEX_OUT, simple_prefilter
+
+    PHRASE_INDEX_OUT.parent.mkdir(parents=True, exist_ok=True)
+    shards.clear(PHRASE_INDEX_OUT)
+    stats = {}
+
+    with open_text(PHRASE_INDEX_OUT, "w", index=True) as out:
+        for ngram_path in (NGRAMS_2_4, NGRAMS_5):
+            for rec in iter_index_records(ngram_path, freq_word, simple_prefilter, stats):
+                out.write(dumps_line(rec))
+    line_index.write_sidecar(PHRASE_INDEX_OUT)
+
+    print("Prefilter done.")
+    print(f"Total records: {stats.get('total', 0)}")
+    print(f"Kept after prefilter: {stats.get('kept', 0)}")
+    print("Prefiltered index written to:", PHRASE_INDEX_OUT.resolve())
+
+
+# словарь униграмм для воркеров: задаётся до создания пула и наследуется при fork
+_freq_word = None
+
+
+def _index_shard(task):
+    """Воркер: входные шарды n-грамм -> один шард индекса; вернуть (записано, stats)."""
+    ngram_parts, out_path, fused = task
+    prefilter = None
+    if fused:
+        from prefilter_phrases import simple_prefilter
+        prefilter = simple_prefilter
+
+    stats = {}
+    written = 0
+    with open_text(out_path, "w", index=True) as out:
+        for part in ngram_parts:
+            for rec in iter_index_records(part, _freq_word, prefilter, stats):
+                out.write(dumps_line(rec))
+                written += 1
+    line_index.write_sidecar(out_path)
+    return written, stats
+
+
+def process_sharded(freq_word, out_path: Path, fused: bool):
+    """
+    Шардированные n-граммы -> шардированный индекс + манифест.
+    Шарды 2–4 и 5-грамм с одинаковым номером идут в один шард индекса.
+    """
+    global _freq_word
+    parts_2_4 = shards.parts(NGRAMS_2_4)
+    parts_5 = shards.parts(NGRAMS_5)
+    if len(parts_2_4) == len(parts_5):
+        groups = [list(g) for g in zip(parts_2_4, parts_5)]
+    else:
+        groups = [[p] for p in parts_2_4 + parts_5]
+
+    n = len(groups)
+    files = [shards.shard_path(out_path, i, n) for i in range(n)]
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    shards.clear(out_path)
+
+    metrics.inc("records_in", sum(len(line_index.load(p)) for g in groups for p in g))
+    _freq_word = freq_word
+    stats = {}
+    records = []
+    with mp.get_context("fork").Pool(min(WORKERS, n)) as pool:
+        tasks = [(g, f, fused) for g, f in zip(groups, files)]
+        for written, st in tqdm(pool.imap(_index_shard, tasks), total=n, desc="index shards"):
+            records.append(written)
+            metrics.inc("records_out", written)
+            for k, v in st.items():
+                stats[k] = stats.get(k, 0) + v
+    shards.write_manifest(out_path, files, records)
+    return stats
 
 
 def main():
     freq_word = load_unigrams()
+
+    sharded = len(shards.parts(NGRAMS_2_4)) > 1 or len(shards.parts(NGRAMS_5)) > 1
+    if sharded:
+        if FUSED_PREFILTER:
+            from prefilter_phrases import PHRASE_INDEX_OUT
+            stats = process_sharded(freq_word, PHRASE_INDEX_OUT, fused=True)
+            print("Prefilter done.")
+            print(f"Total records: {stats.get('total', 0)}")
+            print(f"Kept after prefilter: {stats.get('kept', 0)}")
+            print("Prefiltered index shards:", shards.manifest_path(PHRASE_INDEX_OUT).resolve())
+        else:
+            process_sharded(freq_word, PHRASE_INDEX, fused=False)
+            print("Index shards:", shards.manifest_path(PHRASE_INDEX).resolve())
+        return
+
+    if FUSED_PREFILTER:
+        process_fused(freq_word)
+        return
+
     PHRASE_INDEX.parent.mkdir(parents=True, exist_ok=True)
+    shards.clear(PHRASE_INDEX)
 
-    with PHRASE_INDEX.open("w", encoding="utf-8") as out:
+    with open_text(PHRASE_INDEX, "w", index=True) as out:
         process_ngrams(NGRAMS_2_4, freq_word, out)
         process_ngrams(NGRAMS_5, freq_word, out)
+    line_index.write_sidecar(PHRASE_INDEX)
 
     print("Index written to:", PHRASE_INDEX.resolve())
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("build_index"):
+        profiling.run(main, "build_index", PHRASE_INDEX.parent,
+                      outputs=("PHRASE_INDEX", "prefilter_phrases.PHRASE_INDEX_OUT"))
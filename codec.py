@@ -0,0 +1,167 @@
+"""
+Быстрый JSON-кодек для построчных jsonl всех стадий.
+
+Бэкенд выбирается при импорте: orjson (loads/dumps) и msgspec (типизированные
+декодеры) — если установлены, иначе stdlib json. Вывод всегда utf-8 без
+экранирования (как json.dumps(..., ensure_ascii=False)), но компактный — без пробелов.
+
+Типизированные декодеры для фиксированных форм записей:
+- decode_text(line)   -> text корпусной записи {"text": ...}
+- decode_count(line)  -> (text, count) из freq_*.jsonl
+- decode_phrase(line) -> PhraseRecord из phrase_index*.jsonl
+С msgspec они не строят промежуточный dict и пропускают лишние поля.
+
+Микробенчмарк: python codec.py
+"""
+import json
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+BACKEND = "orjson" if orjson else ("msgspec" if msgspec else "json")
+
+
+# ==========================
+#   loads / dumps
+# ==========================
+
+if orjson is not None:
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def dumps_line(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE).decode("utf-8")
+
+elif msgspec is not None:
+    _encode = msgspec.json.encode
+    loads = msgspec.json.decode
+
+    def dumps(obj) -> str:
+        return _encode(obj).decode("utf-8")
+
+    def dumps_line(obj) -> str:
+        return _encode(obj).decode("utf-8") + "\n"
+
+else:
+    loads = json.loads
+    _stdlib_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    def dumps(obj) -> str:
+        return _stdlib_encode(obj)
+
+    def dumps_line(obj) -> str:
+        return _stdlib_encode(obj) + "\n"
+
+
+def encode_count(text: str, count: int) -> str:
+    """Строка freq_*.jsonl: {"text": ..., "count": ...}."""
+    return dumps_line({"text": text, "count": count})
+
+
+# ==========================
+#   ТИПИЗИРОВАННЫЕ ДЕКОДЕРЫ
+# ==========================
+
+if msgspec is not None:
+    class TextRecord(msgspec.Struct):
+        text: Optional[str] = ""
+
+    class CountRecord(msgspec.Struct):
+        text: str
+        count: int
+
+    class PhraseRecord(msgspec.Struct):
+        phrase: str
+        freq_phrase: int
+        n: int = 0
+        word_importance: float = 0.0
+
+    _text_decoder = msgspec.json.Decoder(TextRecord)
+    _count_decoder = msgspec.json.Decoder(CountRecord)
+    _phrase_decoder = msgspec.json.Decoder(PhraseRecord)
+
+    def decode_text(line) -> str:
+        # {"text": null} -> "" — как в stdlib-ветке
+        return _text_decoder.decode(line).text or ""
+
+    def decode_count(line):
+        r = _count_decoder.decode(line)
+        return r.text, r.count
+
+    def decode_phrase(line) -> "PhraseRecord":
+        return _phrase_decoder.decode(line)
+
+else:
+    class PhraseRecord:
+        __slots__ = ("phrase", "freq_phrase", "n", "word_importance")
+
+        def __init__(self, phrase, freq_phrase, n=0, word_importance=0.0):
+            self.phrase = phrase
+            self.freq_phrase = freq_phrase
+            self.n = n
+            self.word_importance = word_importance
+
+    def decode_text(line) -> str:
+        return loads(line).get("text") or ""
+
+    def decode_count(line):
+        obj = loads(line)
+        return obj["text"], obj["count"]
+
+    def decode_phrase(line) -> PhraseRecord:
+        obj = loads(line)
+        return PhraseRecord(obj["phrase"], obj["freq_phrase"],
+                            obj.get("n", 0), obj.get("word_importance", 0.0))
+
+
+# ==========================
+#   МИКРОБЕНЧМАРК
+# ==========================
+
+def _bench(n: int = 200_000):
+    import random
+    import timeit
+
+    rng = random.Random(0)
+    words = ["hola", "qué", "pasa", "señor", "vamos", "está", "niño", "¿dónde", "aquí"]
+    corpus = [json.dumps({"id": f"os_{i}", "source": "opensubs",
+                          "text": " ".join(rng.choices(words, k=rng.randint(2, 12)))},
+                         ensure_ascii=False) + "\n" for i in range(n)]
+    counts = [json.dumps({"text": " ".join(rng.choices(words, k=3)), "count": rng.randint(1, 10**6)},
+                         ensure_ascii=False) + "\n" for _ in range(n)]
+    phrases = [json.dumps({"phrase": " ".join(rng.choices(words, k=3)), "freq_phrase": 42, "n": 3,
+                           "tokens": words[:3], "word_freqs": [1, 2, 3], "word_importance": 1.5},
+                          ensure_ascii=False) + "\n" for _ in range(n)]
+    objs = [json.loads(s) for s in phrases]
+
+    cases = [
+        ("text record", corpus,
+         lambda s: json.loads(s).get("text", ""), decode_text),
+        ("count record", counts,
+         lambda s: (lambda o: (o["text"], o["count"]))(json.loads(s)), decode_count),
+        ("phrase record", phrases,
+         lambda s: json.loads(s), decode_phrase),
+        ("dumps line", objs,
+         lambda o: json.dumps(o, ensure_ascii=False) + "\n", dumps_line),
+    ]
+
+    print(f"backend: {BACKEND}, msgspec typed decoders: {msgspec is not None}, n = {n}")
+    for name, data, base_fn, fast_fn in cases:
+        t_base = min(timeit.repeat(lambda: [base_fn(x) for x in data], number=1, repeat=3))
+        t_fast = min(timeit.repeat(lambda: [fast_fn(x) for x in data], number=1, repeat=3))
+        print(f"{name:14s} stdlib {n / t_base / 1e6:6.2f} M/s   "
+              f"{BACKEND} {n / t_fast / 1e6:6.2f} M/s   x{t_base / t_fast:.1f}")
+
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,237 @@
+"""
+Общий слой чтения/записи корпусов.
+
+open_text() открывает путь по расширению:
+- *.zst — zstandard (если установлен), сжатие многопоточное;
+  при чтении/дозаписи поддерживаются склеенные фреймы;
+- *.gz  — gzip (через isal.igzip, если установлен — он в разы быстрее);
+- остальное — обычный файл с большим буфером.
+
+Так любую стадию можно перевести на сжатые jsonl, просто поменяв путь.
+Временные spill-файлы счётчика тоже пишутся сжатыми (spill_path).
+
+При записи с index=True поток запоминает смещения начал строк в распакованных байтах —
+line_index.write_sidecar берёт их через written_offsets() вместо повторного
+чтения файла.
+
+LINE_LIMIT (выставляет profiling.run в режиме --profile) обрезает чтение входов
+до первых N строк; файлы, записанные этим же процессом (spill-ы, промежуточные
+сортировки), читаются целиком.
+"""
+import gzip
+import io
+import itertools
+import os
+import tempfile
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен
+    zstandard = None
+
+try:
+    from isal import igzip as _gzip
+except ImportError:
+    _gzip = gzip
+
+# Уровень и потоки zstd (threads=-1 — по числу ядер)
+ZSTD_LEVEL = 3
+ZSTD_THREADS = -1
+# Уровень gzip: для промежуточных файлов скорость важнее степени сжатия
+GZIP_LEVEL = 3
+# Буфер чтения/записи
+BUFFER_SIZE = 1 << 20
+
+# Каталог для временных файлов (None — системный tmp). Лучше класть на NVMe.
+SPILL_DIR = os.environ.get("HABLAI_SPILL_DIR")
+
+# Ограничение числа читаемых строк входа (None — без ограничения)
+LINE_LIMIT = None
+
+_written = set()
+# смещения строк закрытых файлов, записанных в режиме "w" (ключ — abspath)
+_line_offsets = {}
+
+
+def compression(path) -> str:
+    """'zst', 'gz' или '' по расширению пути."""
+    name = str(path)
+    if name.endswith(".zst"):
+        return "zst"
+    if name.endswith(".gz"):
+        return "gz"
+    return ""
+
+
+class _HeadReader:
+    """Поток, при итерации отдающий только первые limit строк."""
+
+    def __init__(self, f, limit: int):
+        self._f = f
+        self._limit = limit
+
+    def __iter__(self):
+        return itertools.islice(self._f, self._limit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class _OffsetTap(io.BufferedIOBase):
+    """
+    Бинарный поток-прослойка под TextIOWrapper: пропускает запись дальше и
+    попутно собирает смещения начал строк; при закрытии кладёт их в _line_offsets.
+    """
+
+    def __init__(self, f, key: str):
+        import numpy as np
+        self._np = np
+        self._f = f
+        self._key = key
+        self._parts = [np.zeros(1, dtype=np.uint64)]
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        np = self._np
+        nl = np.flatnonzero(np.frombuffer(b, dtype=np.uint8) == 10)
+        if len(nl):
+            self._parts.append((nl + (self._pos + 1)).astype(np.uint64))
+        self._pos += len(b)
+        self._f.write(b)
+        return len(b)
+
+    def flush(self):
+        self._f.flush()
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()  # flush() до закрытия нижнего потока
+        self._f.close()
+        offsets = self._np.concatenate(self._parts)
+        # последняя строка без перевода строки
+        if int(offsets[-1]) != self._pos:
+            offsets = self._np.append(offsets, self._np.uint64(self._pos))
+        _line_offsets[self._key] = offsets
+
+
+def written_offsets(path):
+    """
+    Смещения строк файла, только что записанного open_text(path, "w", index=True) и уже закрытого
+    (забираются один раз); None — если таких нет.
+    """
+    return _line_offsets.pop(os.path.abspath(path), None)
+
+
+def open_text(path, mode: str = "r", errors: str = None, index: bool = False):
+    """
+    Открыть текстовый файл (utf-8) на чтение "r", запись "w" или дозапись "a";
+    сжатие выбирается по расширению. index=True (только "w") — собирать смещения
+    строк для line_index.write_sidecar (см. written_offsets).
+    """
+    if mode not in ("r", "w", "a"):
+        raise ValueError(f"unsupported mode: {mode!r}")
+
+    key = os.path.abspath(path)
+    if mode != "r":
+        _written.add(key)
+        _line_offsets.pop(key, None)
+    if index and mode == "w":
+        return io.TextIOWrapper(_OffsetTap(_open_sink(path), key), encoding="utf-8", errors=errors)
+    f = _open(path, mode, errors)
+    if mode == "r" and LINE_LIMIT is not None and key not in _written:
+        return _HeadReader(f, LINE_LIMIT)
+    return f
+
+
+def _open(path, mode: str, errors: str):
+    kind = compression(path)
+
+    if kind == "zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path}: install 'zstandard' to read/write .zst files")
+        if mode == "r":
+            return io.TextIOWrapper(open_bytes(path), encoding="utf-8", errors=errors)
+        # дозапись — просто новый фрейм в конце файла
+        raw = open(path, mode + "b")
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=ZSTD_THREADS)
+        writer = cctx.stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding="utf-8", errors=errors,
+                                write_through=False)
+
+    if kind == "gz":
+        if mode == "r":
+            return _gzip.open(path, "rt", encoding="utf-8", errors=errors)
+        return _gzip.open(path, mode + "t", compresslevel=GZIP_LEVEL,
+                          encoding="utf-8", errors=errors)
+
+    return open(path, mode, encoding="utf-8", errors=errors, buffering=BUFFER_SIZE)
+
+
+def _open_sink(path):
+    """Бинарный поток записи (сжатие по расширению) для open_text(path, "w", index=True)."""
+    kind = compression(path)
+    if kind == "zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path}: install 'zstandard' to read/write .zst files")
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=ZSTD_THREADS)
+        return cctx.stream_writer(open(path, "wb"), closefd=True)
+    if kind == "gz":
+        return _gzip.open(path, "wb", compresslevel=GZIP_LEVEL)
+    return open(path, "wb", buffering=BUFFER_SIZE)
+
+
+def open_bytes(path):
+    """
+    Открыть файл на чтение байтов (распакованных, по расширению).
+    Строки при итерации делятся только по LF — как в line_index.
+    """
+    kind = compression(path)
+    if kind == "zst":
+        if zstandard is None:
+            raise RuntimeError(f"{path}: install 'zstandard' to read .zst files")
+        raw = open(path, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True, closefd=True
+        )
+        return io.BufferedReader(reader, BUFFER_SIZE)
+    if kind == "gz":
+        return _gzip.open(path, "rb")
+    return open(path, "rb", buffering=BUFFER_SIZE)
+
+
+def sync(f) -> None:
+    """
+    flush + fsync несжатого файла; ошибки не глотаются. Для сжатых потоков
+    бесполезен: после краха хвост — недописанный фрейм, поэтому выходы, которые
+    дописываются с чекпоинтом, должны быть несжатыми (см. filter_phrases_llm).
+    """
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def spill_suffix() -> str:
+    """Расширение временных файлов: zstd, если есть, иначе gzip."""
+    return ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+
+
+def spill_path(prefix: str) -> str:
+    """Создать пустой временный файл в SPILL_DIR и вернуть его путь."""
+    if SPILL_DIR:
+        Path(SPILL_DIR).mkdir(parents=True, exist_ok=True)
+    fd, fname = tempfile.mkstemp(prefix=prefix, suffix=spill_suffix(), dir=SPILL_DIR)
+    os.close(fd)
+    return fname
@@ -1,11 +1,18 @@
-import json
 import os
-import tempfile
+from multiprocessing import Pool
 from pathlib import Path
 from collections import Counter
 from tqdm import tqdm
 import heapq
 
+import metrics
+import profiling
+import shards
+from codec import decode_count, dumps_line, encode_count
+from corpus_io import open_text, spill_path
+from es_tokenizer import tokenize
+from prefetch import PrefetchReader, decode_texts
+
 # ==========================
 #   КОНФИГУРАЦИЯ
 # ==========================
@@ -20,6 +27,9 @@ OUTPUT_NGRAMS_5   = Path("corpus/jsonl/freq_ngrams_5.jsonl")
 
 # Размер батча (кол-во строк корпуса)
 BATCH_SIZE   = 300_000        # можно менять: 200k–500k
+# Процессы для JSON-декодирования корпуса (0 — декодировать в фоновом потоке чтения;
+# узкое место — подсчёт в основном процессе, так что пул обычно не окупается)
+DECODE_WORKERS = 0
 # Пороги для 5-грамм
 BATCH_MIN_5  = 5              # минимум повторов 5-граммы в одном батче
 GLOBAL_MIN_5 = 30             # минимум повторов 5-граммы в итоговом словаре
@@ -28,191 +38,304 @@ GLOBAL_MIN_5 = 30             # минимум повторов 5-граммы 
 MIN_CHARS = 5
 MAX_CHARS = 5000
 
+# Режим подсчёта:
+#   "exact" — точные частоты через spill/sort/merge
+#   "topk"  — только top-K n-грамм каждого порядка, фиксированная память, без временных файлов:
+#             n-граммы считаются сразу в сводки HeavyHitters, без счётчиков батча, так что
+#             в памяти не больше 2*TOPK_* ключей на порядок (+ n-граммы одной строки)
+MODE = "exact"
+
+# Размеры top-K таблиц для MODE = "topk"
+TOPK_UNI = 1_000_000
+TOPK_2_4 = 5_000_000
+TOPK_5   = 2_000_000
+
+# Число хэш-шардов каждой выходной таблицы (shards.py): 1 — один файл,
+# P > 1 — P отсортированных файлов + манифест, их следующие стадии читают параллельно
+SHARDS = 1
+
 # ==========================
 #   УТИЛИТЫ
 # ==========================
 
 def spill_counter(counter: Counter, tmp_list: list):
-    """Записать Counter -> временный .jsonl файл, сохранить путь в tmp_list."""
-    fd, fname = tempfile.mkstemp(prefix="ngr_", suffix=".jsonl")
-    with os.fdopen(fd, "w", encoding="utf-8") as out:
+    """Записать Counter -> временный сжатый .jsonl файл (в SPILL_DIR), сохранить путь в tmp_list."""
+    fname = spill_path("ngr_")
+    with open_text(fname, "w") as out:
         for key, val in counter.items():
-            out.write(json.dumps({"text": key, "count": val}, ensure_ascii=False) + "\n")
+            out.write(encode_count(key, val))
     tmp_list.append(fname)
 
+    metrics.inc("spills")
+    metrics.inc("spill_records", len(counter))
+    metrics.inc("spill_bytes", os.path.getsize(fname))
+
 
 def sort_jsonl(input_file: str) -> str:
     """
-    Отсортировать JSONL-файл по полю 'text', вернуть путь к .sorted-файлу.
+    Отсортировать JSONL-файл по полю 'text', вернуть путь к .sorted-файлу (исходный удаляется).
     (Файл читается в память; делаем это на уровне уже агрегированных частот, а не сырого корпуса.)
     """
-    sorted_file = input_file + ".sorted"
+    for ext in (".jsonl.zst", ".jsonl.gz", ".jsonl"):
+        if input_file.endswith(ext):
+            sorted_file = input_file[:-len(ext)] + ".sorted" + ext
+            break
+    else:
+        sorted_file = input_file + ".sorted"
     items = []
 
-    with open(input_file, "r", encoding="utf-8") as inp:
+    with open_text(input_file) as inp:
         for line in inp:
-            row = json.loads(line)
-            items.append(row)
+            items.append(decode_count(line))
 
-    items.sort(key=lambda x: x["text"])
+    items.sort(key=lambda x: x[0])
 
-    with open(sorted_file, "w", encoding="utf-8") as out:
-        for obj in items:
-            out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    with open_text(sorted_file, "w") as out:
+        for key, val in items:
+            out.write(encode_count(key, val))
 
+    os.remove(input_file)
     return sorted_file
 
 
 def multiway_merge_sorted(files, output_path: Path):
-    """Слить много отсортированных JSONL-файлов в один, суммируя count (без порога)."""
-    streams = [open(f, "r", encoding="utf-8") for f in files]
+    """Слить много отсортированных JSONL-файлов в один (или SHARDS шардов), суммируя count (без порога)."""
+    streams = [open_text(f) for f in files]
+    metrics.gauge("merge_fan_in", len(files))
 
     def row_iter(stream):
         for line in stream:
-            obj = json.loads(line)
-            yield obj["text"], obj["count"]
+            yield decode_count(line)
 
     iterators = [row_iter(s) for s in streams]
     merged = heapq.merge(*iterators, key=lambda x: x[0])
 
-    with output_path.open("w", encoding="utf-8") as out:
+    with shards.ShardedWriter(output_path, SHARDS) as out:
         last_key = None
         acc = 0
 
         for key, val in merged:
             if key != last_key and last_key is not None:
-                out.write(json.dumps({"text": last_key, "count": acc}, ensure_ascii=False) + "\n")
+                out.write(last_key, encode_count(last_key, acc))
+                metrics.inc("records_out")
                 acc = 0
             last_key = key
             acc += val
 
         if last_key is not None:
-            out.write(json.dumps({"text": last_key, "count": acc}, ensure_ascii=False) + "\n")
+            out.write(last_key, encode_count(last_key, acc))
+            metrics.inc("records_out")
 
     for s in streams:
         s.close()
+    for f in files:
+        os.remove(f)
 
 
 def multiway_merge_sorted_with_min(files, output_path: Path, min_count: int):
-    """Слить много отсортированных JSONL-файлов в один, суммируя count и применяя порог по частоте."""
-    streams = [open(f, "r", encoding="utf-8") for f in files]
+    """Слить много отсортированных JSONL-файлов в один (или SHARDS шардов), суммируя count и применяя порог по частоте."""
+    streams = [open_text(f) for f in files]
+    metrics.gauge("merge_fan_in", len(files))
 
     def row_iter(stream):
         for line in stream:
-            obj = json.loads(line)
-            yield obj["text"], obj["count"]
+            yield decode_count(line)
 
     iterators = [row_iter(s) for s in streams]
     merged = heapq.merge(*iterators, key=lambda x: x[0])
 
-    with output_path.open("w", encoding="utf-8") as out:
+    with shards.ShardedWriter(output_path, SHARDS) as out:
         last_key = None
         acc = 0
 
         for key, val in merged:
             if key != last_key and last_key is not None:
                 if acc >= min_count:
-                    out.write(json.dumps({"text": last_key, "count": acc}, ensure_ascii=False) + "\n")
+                    out.write(last_key, encode_count(last_key, acc))
+                    metrics.inc("records_out")
                 acc = 0
             last_key = key
             acc += val
 
         if last_key is not None and acc >= min_count:
-            out.write(json.dumps({"text": last_key, "count": acc}, ensure_ascii=False) + "\n")
+            out.write(last_key, encode_count(last_key, acc))
+            metrics.inc("records_out")
 
     for s in streams:
         s.close()
+    for f in files:
+        os.remove(f)
+
+
+class HeavyHitters:
+    """
+    Сводка Misra-Gries с пакетным декрементом (вариант Space-Saving для потока батчей).
+
+    Держит не больше 2*k ключей. Когда ключей становится больше, из всех счётчиков
+    вычитается (k+1)-я по величине частота, а нулевые выкидываются.
+    Для любого ключа истинная частота f лежит в [count, count + error],
+    где error — сумма всех вычтенных порогов (error <= N / (k+1)).
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts = Counter()
+        self.error = 0
+
+    def merge(self, batch: Counter):
+        """Влить точные частоты батча в сводку."""
+        self.counts.update(batch)
+        self.trim()
+
+    def trim(self):
+        """
+        Сжать сводку, если в ней больше 2*k ключей. Ключи можно добавлять прямо
+        в counts и звать trim() после каждой строки — счётчик батча тогда не нужен;
+        counts после сжатия — новый объект.
+        """
+        if len(self.counts) > 2 * self.k:
+            self._compact()
+
+    def _compact(self):
+        threshold = sorted(self.counts.values(), reverse=True)[self.k]
+        self.error += threshold
+        self.counts = Counter({key: c - threshold for key, c in self.counts.items()
+                               if c > threshold})
+
+    def write_top(self, output_path: Path, min_count: int = 1):
+        """Записать top-K в формате freq_*.jsonl (сортировка по text) с оценкой ошибки."""
+        top = [(key, c) for key, c in self.counts.most_common(self.k) if c >= min_count]
+        top.sort(key=lambda x: x[0])
+
+        with shards.ShardedWriter(output_path, SHARDS) as out:
+            for key, c in top:
+                out.write(key, dumps_line({"text": key, "count": c, "error": self.error}))
+        metrics.inc("records_out", len(top))
 
 # ==========================
 #   ОСНОВНОЙ ПРОЦЕСС
 # ==========================
 
+def iter_corpus_tokens():
+    """
+    Токены подходящих строк корпуса по блокам чтения: (прочитано строк файла, [tokens, ...]).
+    Чтение и распаковка идут в фоне, JSON декодируется там же или в DECODE_WORKERS процессах (prefetch.py).
+    """
+    pool = Pool(DECODE_WORKERS) if DECODE_WORKERS else None
+    try:
+        with PrefetchReader(INPUT_JSONL, decode_texts, pool) as reader, \
+                tqdm(desc="Reading corpus", unit=" lines") as bar:
+            done = 0
+            for texts in reader:
+                block = []
+                for text in texts:
+                    if not text:
+                        continue
+                    if len(text) < MIN_CHARS or len(text) > MAX_CHARS:
+                        continue
+
+                    tokens = tokenize(text)
+                    if tokens:
+                        block.append(tokens)
+
+                metrics.inc("records_in", reader.lines - done)
+                bar.update(reader.lines - done)
+                done = reader.lines
+                yield done, block
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def count_ngrams(tokens, counter_uni, counter_2_4, counter_5):
+    """Добавить униграммы и 2–5-граммы одной строки в счётчики."""
+    # униграммы
+    counter_uni.update(tokens)
+
+    # 2–5-граммы
+    L = len(tokens)
+    for n in range(2, 6):
+        if L < n:
+            break
+        for j in range(L - n + 1):
+            ngram = " ".join(tokens[j:j+n])
+            if n < 5:
+                counter_2_4[ngram] += 1
+            else:
+                counter_5[ngram] += 1
+
+
+def count_batches():
+    """
+    Прочитать корпус и считать n-граммы батчами примерно по BATCH_SIZE строк.
+    Отдаёт (counter_uni, counter_2_4, counter_5) после каждого батча;
+    счётчики очищаются после возврата управления.
+    """
+    counter_uni = Counter()
+    counter_2_4 = Counter()
+    counter_5 = Counter()
+
+    flushed = 0
+    for done, block in iter_corpus_tokens():
+        for tokens in block:
+            count_ngrams(tokens, counter_uni, counter_2_4, counter_5)
+
+        # сброс батча
+        if done - flushed >= BATCH_SIZE:
+            flushed = done
+            print(f"--- Flushing batch at {done} lines")
+            # счётчики батча на пике — снимок памяти перед spill-ом (--profile)
+            profiling.snapshot(f"batch flush at {done} lines")
+
+            yield counter_uni, counter_2_4, counter_5
+
+            counter_uni.clear()
+            counter_2_4.clear()
+            counter_5.clear()
+
+    # хвостовой батч
+    if counter_uni or counter_2_4 or counter_5:
+        profiling.snapshot("tail batch")
+        yield counter_uni, counter_2_4, counter_5
+
+
 def process():
     # списки временных файлов
     tmp_uni = []
     tmp_2_4 = []
     tmp_5 = []
 
-    counter_uni = Counter()
-    counter_2_4 = Counter()
-    counter_5 = Counter()
-
-    with INPUT_JSONL.open("r", encoding="utf-8") as f:
-        for i, line in enumerate(tqdm(f, desc="Reading corpus")):
-            line = line.strip()
-            if not line:
-                continue
-
-            obj = json.loads(line)
-            text = obj.get("text", "")
-
-            if not text:
-                continue
-            if len(text) < MIN_CHARS or len(text) > MAX_CHARS:
-                continue
-
-            tokens = text.split()
-            L = len(tokens)
-            if not L:
-                continue
-
-            # униграммы
-            counter_uni.update(tokens)
-
-            # 2–5-граммы
-            for n in range(2, 6):
-                if L < n:
-                    break
-                for j in range(L - n + 1):
-                    ngram = " ".join(tokens[j:j+n])
-                    if n < 5:
-                        counter_2_4[ngram] += 1
-                    else:
-                        counter_5[ngram] += 1
-
-            # сброс батча
-            if (i + 1) % BATCH_SIZE == 0:
-                print(f"--- Flushing batch at {i+1} lines")
-
-                spill_counter(counter_uni, tmp_uni)
-                spill_counter(counter_2_4, tmp_2_4)
-
-                # 5-граммы: оставляем только те, что достаточно частые в батче
-                if counter_5:
-                    filtered_5 = Counter({ng: c for ng, c in counter_5.items()
-                                          if c >= BATCH_MIN_5})
-                    if filtered_5:
-                        spill_counter(filtered_5, tmp_5)
-
-                counter_uni.clear()
-                counter_2_4.clear()
-                counter_5.clear()
+    for counter_uni, counter_2_4, counter_5 in count_batches():
+        if counter_uni:
+            spill_counter(counter_uni, tmp_uni)
+        if counter_2_4:
+            spill_counter(counter_2_4, tmp_2_4)
 
-    # хвостовой батч
-    if counter_uni:
-        spill_counter(counter_uni, tmp_uni)
-    if counter_2_4:
-        spill_counter(counter_2_4, tmp_2_4)
-    if counter_5:
-        filtered_5 = Counter({ng: c for ng, c in counter_5.items()
-                              if c >= BATCH_MIN_5})
-        if filtered_5:
-            spill_counter(filtered_5, tmp_5)
+        # 5-граммы: оставляем только те, что достаточно частые в батче
+        if counter_5:
+            filtered_5 = Counter({ng: c for ng, c in counter_5.items()
+                                  if c >= BATCH_MIN_5})
+            if filtered_5:
+                spill_counter(filtered_5, tmp_5)
 
     print("Sorting temporary files...")
 
-    sorted_uni  = [sort_jsonl(f) for f in tmp_uni]
-    sorted_2_4  = [sort_jsonl(f) for f in tmp_2_4]
-    sorted_5    = [sort_jsonl(f) for f in tmp_5]
+    with metrics.timer("sort_seconds"):
+        sorted_uni  = [sort_jsonl(f) for f in tmp_uni]
+        sorted_2_4  = [sort_jsonl(f) for f in tmp_2_4]
+        sorted_5    = [sort_jsonl(f) for f in tmp_5]
 
     print("Merging unigrams...")
-    multiway_merge_sorted(sorted_uni, OUTPUT_UNI)
+    with metrics.timer("merge_seconds"):
+        multiway_merge_sorted(sorted_uni, OUTPUT_UNI)
 
     print("Merging 2–4-grams...")
-    multiway_merge_sorted(sorted_2_4, OUTPUT_NGRAMS_2_4)
+    with metrics.timer("merge_seconds"):
+        multiway_merge_sorted(sorted_2_4, OUTPUT_NGRAMS_2_4)
 
     print(f"Merging 5-grams with GLOBAL_MIN_5 = {GLOBAL_MIN_5} ...")
-    multiway_merge_sorted_with_min(sorted_5, OUTPUT_NGRAMS_5, GLOBAL_MIN_5)
+    with metrics.timer("merge_seconds"):
+        multiway_merge_sorted_with_min(sorted_5, OUTPUT_NGRAMS_5, GLOBAL_MIN_5)
 
     print("Done.")
     print("Unigrams:", OUTPUT_UNI.resolve())
@@ -220,5 +343,35 @@ def process():
     print("Ngrams 5:", OUTPUT_NGRAMS_5.resolve())
 
 
+def process_topk():
+    """
+    Однопроходный top-K подсчёт: на каждый порядок — сводка HeavyHitters фиксированного размера.
+    Никаких временных файлов, сортировки и слияния; в выходных записях есть поле "error".
+    N-граммы каждой строки добавляются прямо в сводки, сжатие — после строки.
+    """
+    hh_uni = HeavyHitters(TOPK_UNI)
+    hh_2_4 = HeavyHitters(TOPK_2_4)
+    hh_5 = HeavyHitters(TOPK_5)
+
+    for _, block in iter_corpus_tokens():
+        for tokens in block:
+            count_ngrams(tokens, hh_uni.counts, hh_2_4.counts, hh_5.counts)
+            hh_uni.trim()
+            hh_2_4.trim()
+            hh_5.trim()
+
+    print(f"Writing top-K tables (K = {TOPK_UNI} / {TOPK_2_4} / {TOPK_5})...")
+    hh_uni.write_top(OUTPUT_UNI)
+    hh_2_4.write_top(OUTPUT_NGRAMS_2_4)
+    hh_5.write_top(OUTPUT_NGRAMS_5, GLOBAL_MIN_5)
+
+    print("Done.")
+    print(f"Unigrams: {OUTPUT_UNI.resolve()} (error <= {hh_uni.error})")
+    print(f"Ngrams 2–4: {OUTPUT_NGRAMS_2_4.resolve()} (error <= {hh_2_4.error})")
+    print(f"Ngrams 5: {OUTPUT_NGRAMS_5.resolve()} (error <= {hh_5.error})")
+
+
 if __name__ == "__main__":
-    process()
+    with metrics.stage("count"):
+        profiling.run(process_topk if MODE == "topk" else process, "count", OUTPUT_UNI.parent,
+                      outputs=("OUTPUT_UNI", "OUTPUT_NGRAMS_2_4", "OUTPUT_NGRAMS_5"))
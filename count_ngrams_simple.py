@@ -3,6 +3,12 @@ from pathlib import Path
 from collections import Counter
 from tqdm import tqdm
 
+import metrics
+import profiling
+from codec import decode_text
+from corpus_io import open_text
+from es_tokenizer import tokenize
+
 # Входной объединённый корпус
 INPUT_JSONL = Path("corpus/jsonl/mix_es_60os_40c4.jsonl")
 
@@ -19,21 +25,21 @@ def main():
     unigram_counter = Counter()
     ngram_counter = Counter()
 
-    with INPUT_JSONL.open("r", encoding="utf-8") as f:
+    with open_text(INPUT_JSONL) as f:
         for line in tqdm(f, desc=f"reading {INPUT_JSONL.name}"):
+            metrics.inc("records_in")
             line = line.strip()
             if not line:
                 continue
 
-            obj = json.loads(line)
-            text = obj.get("text", "").strip()
+            text = decode_text(line).strip()
             if not text:
                 continue
             if len(text) < MIN_CHARS or len(text) > MAX_CHARS:
                 continue
 
-            # очень простая токенизация по пробелам
-            tokens = text.split()
+            # общий токенизатор: пунктуация отделяется, элизии сохраняются
+            tokens = tokenize(text)
             if not tokens:
                 continue
 
@@ -55,10 +61,10 @@ def main():
     UNIGRAMS_OUT.parent.mkdir(parents=True, exist_ok=True)
 
     # Преобразуем Counter в обычный словарь для json
-    with UNIGRAMS_OUT.open("w", encoding="utf-8") as f_out:
+    with open_text(UNIGRAMS_OUT, "w") as f_out:
         json.dump(unigram_counter, f_out, ensure_ascii=False)
 
-    with NGRAMS_OUT.open("w", encoding="utf-8") as f_out:
+    with open_text(NGRAMS_OUT, "w") as f_out:
         json.dump(ngram_counter, f_out, ensure_ascii=False)
 
     print("Готово.")
@@ -69,4 +75,6 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("count_simple"):
+        profiling.run(main, "count_simple", UNIGRAMS_OUT.parent,
+                      outputs=("UNIGRAMS_OUT", "NGRAMS_OUT"))
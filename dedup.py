@@ -0,0 +1,219 @@
+"""
+Дедупликация строк и документов корпуса.
+
+- "exact": 64-битные отпечатки нормализованной строки (blake2b) в компактной
+  хэш-таблице с открытой адресацией на NumPy — фиксированная память, без dict/set.
+- "near": MinHash + LSH по словесным шинглам (для документов C4); ключи бэндов
+  хранятся в такой же таблице отпечатков.
+
+Ключи (отпечатки, ключи бэндов) считаются функцией dedup_keys() и могут
+вычисляться в воркерах; проверка по таблице — в одном процессе через Deduper.
+Размер таблицы подбирается по числу строк источника (Deduper(mode, lines=...)).
+"""
+import math
+import zlib
+from hashlib import blake2b
+
+import numpy as np
+
+# Размер таблицы отпечатков: 2**CAPACITY_LOG2 ячеек по 8 байт (27 -> 1 GiB) —
+# по умолчанию и верхняя граница; при известном числе строк таблица меньше,
+# но не меньше 2**MIN_CAPACITY_LOG2 ячеек
+CAPACITY_LOG2 = 27
+MIN_CAPACITY_LOG2 = 16
+# Максимальная заполненность таблицы; дальше новые ключи не запоминаются
+MAX_LOAD = 0.7
+
+# Параметры MinHash/LSH для режима "near"
+NUM_PERM = 64
+BANDS = 16
+SHINGLE = 5
+MINHASH_SEED = 42
+
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def normalize_line(text: str) -> str:
+    """Нормализация для точного сравнения: регистр и пробелы не важны."""
+    return " ".join(text.casefold().split())
+
+
+def fingerprints(texts) -> np.ndarray:
+    """64-битные отпечатки нормализованных строк."""
+    digests = b"".join(
+        blake2b(normalize_line(t).encode("utf-8"), digest_size=8).digest()
+        for t in texts
+    )
+    return np.frombuffer(digests, dtype="<u8").astype(np.uint64)
+
+
+def table_log2(n_keys: int, max_load: float = MAX_LOAD) -> int:
+    """log2 размера таблицы, в которую n_keys ключей помещаются без насыщения."""
+    need = max(1, math.ceil(n_keys / max_load))
+    return min(CAPACITY_LOG2, max(MIN_CAPACITY_LOG2, (need - 1).bit_length()))
+
+
+class FingerprintSet:
+    """
+    Множество 64-битных ключей: open addressing + линейное пробирование,
+    вставка пачками векторно. 0 зарезервирован под пустую ячейку.
+    """
+
+    def __init__(self, capacity_log2: int = CAPACITY_LOG2, max_load: float = MAX_LOAD):
+        self.table = np.zeros(1 << capacity_log2, dtype=np.uint64)
+        self.mask = np.uint64((1 << capacity_log2) - 1)
+        self.limit = int(len(self.table) * max_load)
+        self.size = 0
+        self.saturated = False
+
+    def __len__(self):
+        return self.size
+
+    def add_batch(self, keys) -> np.ndarray:
+        """
+        Добавить ключи; вернуть маску «ключ встретился впервые»
+        (повтор внутри пачки тоже считается повтором).
+        Новые ключи запоминаются, пока заполненность не дойдёт до limit; дальше
+        работает только поиск: неизвестные ключи считаются новыми.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        keys = np.where(keys == 0, np.uint64(1), keys)
+        uniq, first = np.unique(keys, return_index=True)
+
+        insert = not self.saturated
+
+        new_u = np.zeros(len(uniq), dtype=bool)
+        pending = np.arange(len(uniq))
+        slots = (uniq & self.mask).astype(np.int64)
+        step_mask = int(self.mask)
+
+        while pending.size:
+            want = uniq[pending]
+            cur = self.table[slots]
+            found = cur == want
+            empty = cur == 0
+            done = found.copy()
+
+            e_pos = np.flatnonzero(empty)
+            if e_pos.size:
+                if insert:
+                    # в одну пустую ячейку претендуют несколько ключей — побеждает первый,
+                    # остальные на следующем круге увидят занятую ячейку и пойдут дальше
+                    _, first_e = np.unique(slots[e_pos], return_index=True)
+                    win = e_pos[first_e]
+                    room = self.limit - self.size
+                    if len(win) >= room:
+                        # остальные ключи на следующем круге пройдут как при поиске
+                        win = win[:room]
+                        self.saturated, insert = True, False
+                        print(f"[dedup] fingerprint table saturated at {self.limit} keys, "
+                              f"new keys are no longer remembered")
+                    self.table[slots[win]] = want[win]
+                    self.size += len(win)
+                    done[win] = True
+                    new_u[pending[win]] = True
+                else:
+                    done[e_pos] = True
+                    new_u[pending[e_pos]] = True
+
+            advance = ~done & ~empty
+            slots = np.where(advance, (slots + 1) & step_mask, slots)
+            keep = ~done
+            pending = pending[keep]
+            slots = slots[keep]
+
+        is_new = np.zeros(len(keys), dtype=bool)
+        is_new[first[new_u]] = True
+        return is_new
+
+
+class MinHasher:
+    """MinHash-сигнатура по словесным шинглам и LSH-ключи бэндов."""
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS,
+                 shingle: int = SHINGLE, seed: int = MINHASH_SEED):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        rng = np.random.default_rng(seed)
+        self.shingle = shingle
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)[:, None]
+        self.row_mult = rng.integers(1, 1 << 63, self.rows, dtype=np.uint64) | np.uint64(1)
+        self.band_salt = rng.integers(1, 1 << 63, bands, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.casefold().split()
+        k = self.shingle
+        if len(words) <= k:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+        h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                        dtype=np.uint64, count=len(shingles))
+        return ((self.a * h + self.b) % _PRIME).min(axis=1)
+
+    def band_keys(self, text: str) -> np.ndarray:
+        sig = self.signature(text).reshape(self.bands, self.rows)
+        return (sig * self.row_mult).sum(axis=1) ^ self.band_salt
+
+
+_MINHASHER = None
+
+
+def dedup_keys(mode: str, texts) -> np.ndarray:
+    """
+    Ключи для Deduper.check_keys(): форма (n,) для "exact", (n, BANDS) для "near".
+    Чистая функция — её можно звать в воркерах.
+    """
+    global _MINHASHER
+    if mode == "exact":
+        return fingerprints(texts)
+    if mode == "near":
+        if _MINHASHER is None:
+            _MINHASHER = MinHasher()
+        if not texts:
+            return np.zeros((0, _MINHASHER.bands), dtype=np.uint64)
+        return np.stack([_MINHASHER.band_keys(t) for t in texts])
+    raise ValueError(f"unknown dedup mode: {mode!r}")
+
+
+class Deduper:
+    """
+    Фильтр повторов со статистикой: mode = "exact" | "near".
+    lines — сколько строк будет проверено: таблица берётся под их ключи
+    (в режиме "near" — BANDS ключей на строку); без него — 2**CAPACITY_LOG2.
+    """
+
+    def __init__(self, mode: str, capacity_log2: int = None, lines: int = None):
+        if mode not in ("exact", "near"):
+            raise ValueError(f"unknown dedup mode: {mode!r}")
+        if capacity_log2 is None:
+            capacity_log2 = CAPACITY_LOG2 if lines is None else \
+                table_log2(lines * (BANDS if mode == "near" else 1))
+        self.mode = mode
+        self.seen_keys = FingerprintSet(capacity_log2)
+        self.seen = 0
+        self.removed = 0
+
+    def check_keys(self, keys: np.ndarray) -> np.ndarray:
+        """Маска «оставить» для пачки ключей из dedup_keys()."""
+        if self.mode == "exact":
+            keep = self.seen_keys.add_batch(keys)
+        else:
+            is_new = self.seen_keys.add_batch(keys.reshape(-1))
+            # документ — почти-дубликат, если хоть один его бэнд уже встречался
+            keep = is_new.reshape(keys.shape).all(axis=1)
+        self.seen += len(keep)
+        self.removed += len(keep) - int(keep.sum())
+        return keep
+
+    def filter(self, texts) -> np.ndarray:
+        """Маска «оставить» для пачки текстов."""
+        return self.check_keys(dedup_keys(self.mode, texts))
+
+    def report(self, name: str):
+        share = self.removed / self.seen if self.seen else 0.0
+        print(f"[dedup] {name}: {self.mode}, removed {self.removed} of {self.seen} "
+              f"({share:.2%})")
@@ -1,30 +1,64 @@
 import json
+import os
 import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
-from datasets import load_dataset
 from tqdm import tqdm
 
+import line_index
+import metrics
+import profiling
+from codec import decode_text, dumps_line
+from corpus_io import open_text
+
 # ========= НАСТРОЙКИ =========
 MAX_DOCS = 6_000_000              # сколько документов взять
 OUTPUT_JSONL = Path("corpus/jsonl/c4_es_sample.jsonl")
 SOURCE_NAME = "c4_es"
 SPLIT = "train"                   # train/validation
+
+# Локальные шарды c4-es (*.json.gz). None — стримить allenai/c4 из сети.
+LOCAL_SHARDS_DIR = None           # например Path("corpus/c4_es_shards")
+# Результаты по шардам + манифест готовых шардов (для резюма)
+PARTS_DIR = Path("corpus/jsonl/c4_es_parts")
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
 # =============================
 
-# Простейшая очистка
-RE_SPACES = re.compile(r"\s+")
-RE_URL = re.compile(r"https?://\S+")
-RE_TAG = re.compile(r"<[^>]+>")
+# Простейшая очистка: любая серия из URL, тегов и пробелов -> один пробел, за один проход
+RE_CLEAN = re.compile(r"(?:https?://\S+|<[^>]+>|\s)+")
+
 
 def clean_text(text: str) -> str:
-    text = RE_URL.sub(" ", text)
-    text = RE_TAG.sub(" ", text)
-    text = RE_SPACES.sub(" ", text)
-    return text.strip()
+    return RE_CLEAN.sub(" ", text).strip()
 
 
-def main():
+def make_record(text: str):
+    """Очистить и отфильтровать документ; вернуть запись для jsonl или None."""
+    if not text:
+        return None
+
+    text = clean_text(text)
+    if not text:
+        return None
+
+    # фильтр по длине, при желании подстрой
+    if len(text) < 20 or len(text) > 2000:
+        return None
+
+    return {
+        "source": SOURCE_NAME,
+        "text": text,
+    }
+
+
+# ==========================
+#   СТРИМИНГ С HF
+# ==========================
+
+def dump_streaming():
+    from datasets import load_dataset
+
     print(f"Loading allenai/c4 config='es', split='{SPLIT}' (streaming=True)...")
 
     ds = load_dataset(
@@ -34,32 +68,137 @@ def main():
         streaming=True,
     )
 
-    OUTPUT_JSONL.parent.mkdir(parents=True, exist_ok=True)
-
     count = 0
-    with OUTPUT_JSONL.open("w", encoding="utf-8") as out:
+    with open_text(OUTPUT_JSONL, "w", index=True) as out:
         for row in tqdm(ds, desc="reading c4-es"):
-            text = row.get("text", "")
-            if not text:
+            metrics.inc("records_in")
+            obj = make_record(row.get("text", ""))
+            if obj is None:
                 continue
 
-            text = clean_text(text)
-            if not text:
+            out.write(dumps_line(obj))
+            metrics.inc("records_out")
+            count += 1
+
+            if count >= MAX_DOCS:
+                break
+
+    return count
+
+
+# ==========================
+#   ЛОКАЛЬНЫЕ ШАРДЫ
+# ==========================
+
+def _part_path(shard: Path) -> Path:
+    return PARTS_DIR / (shard.name.removesuffix(".json.gz") + ".jsonl")
+
+
+def _load_manifest(manifest: Path) -> dict:
+    if manifest.exists():
+        try:
+            return json.loads(manifest.read_text(encoding="utf-8"))
+        except ValueError:
+            return {}
+    return {}
+
+
+def _save_manifest(manifest: Path, done: dict) -> None:
+    tmp = manifest.with_suffix(".tmp")
+    tmp.write_text(json.dumps(done, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(manifest)
+
+
+def process_shard(shard: Path, part: Path, max_docs: int) -> int:
+    """Один шард -> part-файл (атомарно через .tmp); вернуть число документов."""
+    tmp = part.with_suffix(".tmp")
+    count = 0
+    with open_text(shard) as inp, open_text(tmp, "w") as out:
+        for line in inp:
+            obj = make_record(decode_text(line))
+            if obj is None:
                 continue
+            out.write(dumps_line(obj))
+            count += 1
+            if count >= max_docs:
+                break
+    tmp.replace(part)
+    return count
+
+
+def dump_local_shards():
+    """
+    Параллельная обработка локальных шардов в пуле процессов.
+    Готовые шарды записываются в манифест и при перезапуске пропускаются.
+    Каждому запущенному шарду резервируется его доля оставшегося бюджета MAX_DOCS
+    (поровну на свободные слоты пула), неизрасходованный резерв возвращается по
+    завершении шарда. Шард, упёршийся в свою долю, в манифест не попадает: при
+    перезапуске он пересчитывается с новым бюджетом.
+    """
+    PARTS_DIR.mkdir(parents=True, exist_ok=True)
+    manifest = PARTS_DIR / "manifest.json"
+
+    shards = sorted(LOCAL_SHARDS_DIR.glob("*.json.gz"))
+    done = _load_manifest(manifest)
+    done = {name: n for name, n in done.items() if _part_path(Path(name)).exists()}
+    total = sum(done.values())
+    todo = [s for s in shards if s.name not in done]
+    partial = {}
+    print(f"Shards: {len(shards)}, already done: {len(done)} ({total} docs)")
+
+    with ProcessPoolExecutor(WORKERS) as ex, \
+            tqdm(total=len(shards), initial=len(done), desc="c4-es shards") as bar:
+        running = {}
+        reserved = 0
+        while todo or running:
+            while todo and len(running) < WORKERS and total + reserved < MAX_DOCS:
+                budget = MAX_DOCS - total - reserved
+                cap = -(-budget // (WORKERS - len(running)))
+                shard = todo.pop(0)
+                running[ex.submit(process_shard, shard, _part_path(shard), cap)] = shard, cap
+                reserved += cap
+            if not running:
+                break
 
-            # фильтр по длине, при желании подстрой
-            if len(text) < 20 or len(text) > 2000:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                shard, cap = running.pop(fut)
+                reserved -= cap
+                n = fut.result()
+                total += n
+                metrics.inc("shards_done")
+                metrics.inc("records_out", n)
+                if n < cap:
+                    done[shard.name] = n
+                    _save_manifest(manifest, done)
+                else:
+                    partial[shard.name] = n
+                bar.update()
+
+    # склейка готовых шардов по порядку, с глобальным лимитом MAX_DOCS
+    count = 0
+    with open_text(OUTPUT_JSONL, "w", index=True) as out:
+        for shard in shards:
+            if (shard.name not in done and shard.name not in partial) or count >= MAX_DOCS:
                 continue
+            with open_text(_part_path(shard)) as inp:
+                for line in inp:
+                    out.write(line)
+                    count += 1
+                    if count >= MAX_DOCS:
+                        break
 
-            obj = {
-                "source": SOURCE_NAME,
-                "text": text,
-            }
-            out.write(json.dumps(obj, ensure_ascii=False) + "\n")
-            count += 1
+    return count
 
-            if count >= MAX_DOCS:
-                break
+
+def main():
+    OUTPUT_JSONL.parent.mkdir(parents=True, exist_ok=True)
+
+    if LOCAL_SHARDS_DIR is not None:
+        count = dump_local_shards()
+    else:
+        count = dump_streaming()
+    line_index.write_sidecar(OUTPUT_JSONL)
 
     print("-----")
     print("Сохранено документов:", count)
@@ -67,4 +206,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("dump_c4"):
+        profiling.run(main, "dump_c4", OUTPUT_JSONL.parent, outputs=("OUTPUT_JSONL", "PARTS_DIR"))
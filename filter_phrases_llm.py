@@ -1,8 +1,15 @@
 #!/usr/bin/env python
-import json, re, os, time, requests
+import json, re, time, requests
 from pathlib import Path
 from tqdm import tqdm
 
+import line_index
+import metrics
+import profiling
+import shards
+from codec import dumps_line, loads
+from corpus_io import compression, open_text, sync
+
 # ==========================
 #   ПУТИ
 # ==========================
@@ -61,6 +68,38 @@ def save_checkpoint(last_line: int) -> None:
     tmp.replace(CHECKPOINT)
 
 
+# ==========================
+#   ВХОД
+# ==========================
+
+
+def iter_input(resume_from: int):
+    """
+    (номер строки, строка) входа после resume_from. Шардированный вход (манифест)
+    читается шардами подряд со сквозной нумерацией строк. По индексу строк
+    продолжаем сразу с нужного места, без сканирования сначала.
+    """
+    parts = shards.parts(PHRASE_INDEX)
+    base = 0
+    for i, part in enumerate(parts):
+        first = resume_from + 1 - base  # первая нужная строка в этом шарде
+        idx = line_index.load(part) if first > 0 or i + 1 < len(parts) else None
+        if idx is not None and first >= len(idx):
+            base += len(idx)
+            continue
+
+        if first > 0 and idx.seekable:
+            f, n0 = idx.open_at(first), first
+        else:
+            f, n0 = open_text(part), 0
+        with f:
+            for n, line in enumerate(f, n0):
+                if n >= first:
+                    yield base + n, line
+        if idx is not None:
+            base += len(idx)
+
+
 # ==========================
 #   LLM
 # ==========================
@@ -154,21 +193,25 @@ def call_llm(batch):
     # --- основная попытка запроса ---
     while True:
         try:
-            resp = SESSION.post(
-                f"{BASE_URL}/chat/completions",
-                headers={"Authorization": f"Bearer {API_KEY}"},
-                json=payload,
-                timeout=120,
-            )
+            with metrics.timer("llm_latency_seconds"):
+                resp = SESSION.post(
+                    f"{BASE_URL}/chat/completions",
+                    headers={"Authorization": f"Bearer {API_KEY}"},
+                    json=payload,
+                    timeout=120,
+                )
         except Exception as e:
             print("[LLM ERROR] request failed, retrying:", e)
+            metrics.inc("llm_retries")
             time.sleep(5)
             continue
 
+        metrics.inc("llm_requests")
         if resp.status_code == 200:
             break
 
         print("[LLM ERROR] HTTP", resp.status_code, resp.text[:200])
+        metrics.inc("llm_retries")
         time.sleep(5)
 
     data = resp.json()
@@ -180,6 +223,7 @@ def call_llm(batch):
     except Exception as e:
         print("[JSON ERROR] batch-level error:", e)
         print("[JSON ERROR] falling back to per-item evaluation…")
+        metrics.inc("llm_fallback_batches")
 
         # === Индивидуальная обработка каждого элемента ===
         results = {}
@@ -199,13 +243,16 @@ def call_llm(batch):
             ok = False
             for attempt in range(3):
                 try:
-                    r = SESSION.post(
-                        f"{BASE_URL}/chat/completions",
-                        headers={"Authorization": f"Bearer {API_KEY}"},
-                        json=single_payload,
-                        timeout=120,
-                    )
+                    with metrics.timer("llm_latency_seconds"):
+                        r = SESSION.post(
+                            f"{BASE_URL}/chat/completions",
+                            headers={"Authorization": f"Bearer {API_KEY}"},
+                            json=single_payload,
+                            timeout=120,
+                        )
+                    metrics.inc("llm_requests")
                     if r.status_code != 200:
+                        metrics.inc("llm_retries")
                         time.sleep(2)
                         continue
 
@@ -219,6 +266,7 @@ def call_llm(batch):
                     ok = True
                     break
                 except Exception:
+                    metrics.inc("llm_retries")
                     time.sleep(1)
 
             if not ok:
@@ -243,6 +291,9 @@ def call_llm(batch):
 
 
 def main():
+    # выход дописывается после каждого батча и переживает крах только несжатым
+    if compression(OUTPUT_INDEX):
+        raise ValueError(f"{OUTPUT_INDEX}: resumable output must be an uncompressed .jsonl")
     OUTPUT_INDEX.parent.mkdir(parents=True, exist_ok=True)
 
     resume_from = load_checkpoint()
@@ -250,20 +301,16 @@ def main():
 
     mode = "a" if resume_from >= 0 and OUTPUT_INDEX.exists() else "w"
 
-    with PHRASE_INDEX.open("r", encoding="utf-8") as inp, \
-            OUTPUT_INDEX.open(mode, encoding="utf-8") as out:
+    with open_text(OUTPUT_INDEX, mode, index=True) as out:
 
         batch_records = []   # список (line_no, rec)
         batch_for_llm = []   # список {"id": local_id, "text": phrase}
         last_line_no = resume_from
 
-        for line_no, line in enumerate(tqdm(inp, desc="scanning phrase_index")):
-            # пропускаем уже обработанные строки
-            if line_no <= resume_from:
-                continue
-
-            rec = json.loads(line)
+        for line_no, line in tqdm(iter_input(resume_from), desc="scanning phrase_index"):
+            rec = loads(line)
             phrase = rec["phrase"]
+            metrics.inc("records_in")
 
             local_id = len(batch_for_llm)
             batch_records.append((line_no, rec))
@@ -293,11 +340,11 @@ def main():
                     if dec and dec["keep"]:
                         r["llm_keep"] = True
                         r["llm_reason"] = dec["reason"]
-                        out.write(json.dumps(r, ensure_ascii=False) + "\n")
+                        out.write(dumps_line(r))
+                        metrics.inc("records_out")
                 
                 # гарантируем запись на диск
-                out.flush()
-                os.fsync(out.fileno())
+                sync(out)
 
                 if last_line_no >= 0:
                     save_checkpoint(last_line_no)
@@ -321,13 +368,17 @@ def main():
                 if dec and dec["keep"]:
                     r["llm_keep"] = True
                     r["llm_reason"] = dec["reason"]
-                    out.write(json.dumps(r, ensure_ascii=False) + "\n")
+                    out.write(dumps_line(r))
+                    metrics.inc("records_out")
 
             if last_line_no >= 0:
                 save_checkpoint(last_line_no)
 
+    line_index.write_sidecar(OUTPUT_INDEX)
     print("Filtered index written to:", OUTPUT_INDEX.resolve())
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("llm_filter"):
+        profiling.run(main, "llm_filter", OUTPUT_INDEX.parent,
+                      outputs=("OUTPUT_INDEX", "CHECKPOINT"))
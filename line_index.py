@@ -0,0 +1,195 @@
+"""
+Сайдкар-индекс строк для jsonl: <file>.idx.npz рядом с файлом.
+
+- offsets  — uint64[lines + 1]: байтовые смещения начал строк, в конце — размер;
+  для сжатых файлов — смещения в распакованном потоке (seek по ним невозможен,
+  но число строк, сплиты и выборка работают через последовательное чтение);
+- tokens   — uint32[lines], число токенов "text" (только для корпусов, необязательно);
+- size / mtime_ns — индекс считается свежим, только если совпадают с файлом.
+
+Писатели jsonl после закрытия файла вызывают write_sidecar(path[, tokens]) — смещения
+берутся готовыми из corpus_io (собраны при записи), файл заново не читается;
+читатели берут load(path) — если сайдкара нет или он устарел, он перестраивается
+одним проходом: переводы строк ищутся numpy по блокам SCAN_BLOCK.
+
+    idx = line_index.load(path)
+    len(idx)                      # число строк
+    with idx.open_at(n) as f:     # текстовый поток с n-й строки, O(1)
+        ...
+    idx.splits(8)                 # [(start, stop)] — диапазоны строк равного объёма
+    idx.byte_ranges(8)            # те же диапазоны в байтах
+    idx.sample(1000, seed=42)     # равномерная выборка номеров строк
+    for n, line in idx.iter_lines(numbers): ...
+"""
+import io
+from pathlib import Path
+
+import numpy as np
+
+from corpus_io import BUFFER_SIZE, compression, open_bytes, written_offsets
+
+# Писать сайдкары при записи jsonl-артефактов
+WRITE_SIDECARS = True
+
+# Размер блока при поиске переводов строк
+SCAN_BLOCK = 64 << 20
+
+
+def sidecar_path(path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".idx.npz")
+
+
+def scan_offsets(path) -> np.ndarray:
+    """Смещения начал строк (+ размер в конце) одним проходом по файлу."""
+    parts = [np.zeros(1, dtype=np.uint64)]
+    pos = 0
+    with open_bytes(path) as f:
+        while True:
+            buf = f.read(SCAN_BLOCK)
+            if not buf:
+                break
+            nl = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10)
+            parts.append((nl + (pos + 1)).astype(np.uint64))
+            pos += len(buf)
+    offsets = np.concatenate(parts)
+    # последняя строка без перевода строки
+    if int(offsets[-1]) != pos:
+        offsets = np.append(offsets, np.uint64(pos))
+    return offsets
+
+
+class LineIndex:
+    """Смещения строк (и, возможно, число токенов) одного jsonl-файла."""
+
+    def __init__(self, path, offsets: np.ndarray, tokens: np.ndarray = None):
+        if tokens is not None and len(tokens) != len(offsets) - 1:
+            raise ValueError(f"{path}: {len(tokens)} token counts for {len(offsets) - 1} lines")
+        self.path = Path(path)
+        self.offsets = offsets
+        self.tokens = tokens
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def seekable(self) -> bool:
+        return not compression(self.path)
+
+    def save(self):
+        st = self.path.stat()
+        arrays = {
+            "offsets": self.offsets,
+            "size": np.int64(st.st_size),
+            "mtime_ns": np.int64(st.st_mtime_ns),
+        }
+        if self.tokens is not None:
+            arrays["tokens"] = self.tokens.astype(np.uint32, copy=False)
+        sidecar = sidecar_path(self.path)
+        tmp = sidecar.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        tmp.replace(sidecar)
+
+    # ---- чтение ----
+
+    def open_at(self, n: int, errors: str = None):
+        """Текстовый поток, начинающийся с n-й строки (только несжатые файлы)."""
+        if not self.seekable:
+            raise ValueError(f"{self.path}: seek is not supported for compressed files")
+        f = open(self.path, "rb", buffering=BUFFER_SIZE)
+        f.seek(int(self.offsets[min(n, len(self))]))
+        return io.TextIOWrapper(f, encoding="utf-8", errors=errors)
+
+    def iter_lines(self, numbers, errors: str = None):
+        """
+        (номер, строка) для возрастающих номеров строк. Несжатые файлы читаются
+        seek-ами через общий буфер (соседние строки не требуют системных вызовов),
+        сжатые — последовательно.
+        """
+        off = self.offsets
+        if self.seekable:
+            with open(self.path, "rb", buffering=BUFFER_SIZE) as f:
+                for n in numbers:
+                    n = int(n)
+                    f.seek(int(off[n]))
+                    yield n, f.read(int(off[n + 1] - off[n])).decode("utf-8", errors or "strict")
+            return
+
+        it = iter(numbers)
+        want = next(it, None)
+        if want is None:
+            return
+        with open_bytes(self.path) as f:
+            for n, line in enumerate(f):
+                if n < want:
+                    continue
+                yield n, line.decode("utf-8", errors or "strict")
+                want = next(it, None)
+                if want is None:
+                    return
+
+    # ---- разбиение и выборка ----
+
+    def splits(self, k: int):
+        """k диапазонов строк [start, stop) примерно равного объёма в байтах (пустые выкидываются)."""
+        targets = np.linspace(0, int(self.offsets[-1]), k + 1)
+        bounds = np.searchsorted(self.offsets, targets).clip(0, len(self))
+        bounds[0], bounds[-1] = 0, len(self)
+        return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if a < b]
+
+    def byte_ranges(self, k: int):
+        """Те же диапазоны, что splits(k), в байтах: [(start_byte, end_byte)]."""
+        return [(int(self.offsets[a]), int(self.offsets[b])) for a, b in self.splits(k)]
+
+    def sample(self, k: int, seed=None) -> np.ndarray:
+        """Равномерная выборка k разных номеров строк (по возрастанию)."""
+        rng = np.random.default_rng(seed)
+        picked = rng.choice(len(self), size=min(k, len(self)), replace=False)
+        picked.sort()
+        return picked
+
+
+def load(path, build: bool = True):
+    """
+    Индекс файла из свежего сайдкара; иначе (build=True) — перестроить и сохранить,
+    (build=False) — None.
+    """
+    path = Path(path)
+    st = path.stat()
+    sidecar = sidecar_path(path)
+    if sidecar.exists():
+        try:
+            with np.load(sidecar) as z:
+                if int(z["size"]) == st.st_size and int(z["mtime_ns"]) == st.st_mtime_ns:
+                    tokens = z["tokens"] if "tokens" in z.files else None
+                    return LineIndex(path, z["offsets"], tokens)
+        except (OSError, ValueError, KeyError):
+            pass
+    if not build:
+        return None
+
+    idx = LineIndex(path, scan_offsets(path))
+    try:
+        idx.save()
+    except OSError:
+        pass
+    return idx
+
+
+def write_sidecar(path, tokens=None):
+    """
+    Сохранить сайдкар только что записанного файла (вызывать после close).
+    Смещения — собранные при записи open_text(path, "w", index=True); для файлов,
+    дописанных в режиме "a" или записанных иначе, — scan_offsets().
+    """
+    offsets = written_offsets(path)
+    if not WRITE_SIDECARS:
+        return None
+    if offsets is None or (not compression(path) and int(offsets[-1]) != Path(path).stat().st_size):
+        offsets = scan_offsets(path)
+    if tokens is not None:
+        tokens = np.asarray(tokens, dtype=np.uint32)
+    idx = LineIndex(path, offsets, tokens)
+    idx.save()
+    return idx
@@ -1,71 +1,254 @@
-import json
+import os
 import random
+import zlib
+from array import array
+from collections import deque
+from multiprocessing import Pool
 from pathlib import Path
+
+import numpy as np
 from tqdm import tqdm
 
-OS_JSONL = Path("corpus/jsonl/opensubs_es.jsonl")
-C4_JSONL = Path("corpus/jsonl/c4_es_sample.jsonl")
+import corpus_io
+import line_index
+import metrics
+import profiling
+from codec import decode_text
+from corpus_io import open_text
+from dedup import Deduper, dedup_keys
+from es_tokenizer import tokenize
+from prefetch import PrefetchReader, background, split_lines
+
+# Источники и их целевые доли по токенам (нормируются к сумме 1)
+SOURCES = [
+    (Path("corpus/jsonl/opensubs_es.jsonl"), 0.60),
+    (Path("corpus/jsonl/c4_es_sample.jsonl"), 0.40),
+]
 OUT_JSONL = Path("corpus/jsonl/mix_es_60os_40c4.jsonl")
 
-SHARE_OS = 0.60
-SHARE_C4 = 0.40
-
-def estimate_keep_prob():
-    s_os = OS_JSONL.stat().st_size
-    s_c4 = C4_JSONL.stat().st_size
-
-    print(f"OpenSubs size: {s_os / (1024**3):.2f} GB")
-    print(f"C4 size:       {s_c4 / (1024**3):.2f} GB")
-
-    p_keep_os = (SHARE_OS / SHARE_C4) * (s_c4 / s_os)
-    p_keep_os = min(1.0, p_keep_os)
-
-    print(f"Keep probability for OS lines: {p_keep_os:.4f}")
-    return p_keep_os
+SEED = 42
+
+# Буфер перемешивания (строк): выход интерливится и перемешивается в его пределах
+SHUFFLE_BUFFER = 1_000_000
+
+# Декодирование/подсчёт токенов — в пуле процессов
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CHUNK_LINES = 20_000
+
+# Дедупликация по источникам (имя файла -> "exact" | "near"), например
+# {"opensubs_es.jsonl": "exact", "c4_es_sample.jsonl": "near"}.
+# Доли считаются по токенам до дедупликации; интерливинг держит их,
+# а общий объём микса уменьшается на долю выкинутого.
+DEDUP = {}
+
+# Небольшой запас вероятности выборки, чтобы бюджет источника точно набрался
+OVERSAMPLE = 1.02
+
+
+# ==========================
+#   ВОРКЕРЫ
+# ==========================
+
+def _count_block(block: bytes):
+    """Блок строк jsonl -> число токенов в "text" каждой строки (0 для пустых)."""
+    res = []
+    for line in split_lines(block):
+        text = decode_text(line) if line.strip() else ""
+        res.append(len(tokenize(text)) if text else 0)
+    return res
+
+
+def _keys_chunk(lines, dedup_mode):
+    """Строки jsonl -> ключи дедупликации их текстов."""
+    return dedup_keys(dedup_mode, [decode_text(line) for line in lines])
+
+
+def _chunks(items):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= CHUNK_LINES:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ==========================
+#   ИНДЕКС И ВЫБОРКА
+# ==========================
+
+def source_index(path: Path, pool) -> "line_index.LineIndex":
+    """
+    Индекс строк источника с числом токенов на строку. Берётся из сайдкара
+    <file>.idx.npz; если в нём нет токенов — один параллельный предпроход,
+    результат дописывается в сайдкар.
+    """
+    idx = line_index.load(path)
+    if idx.tokens is not None:
+        return idx
+
+    tokens = np.zeros(len(idx), dtype=np.uint32)
+    pos = 0
+    # сайдкар должен описывать весь файл — ограничение --profile здесь не действует
+    with PrefetchReader(path, _count_block, pool, depth=2 * WORKERS, respect_limit=False) as reader, \
+            tqdm(total=len(idx), desc=f"counting tokens in {path.name}") as bar:
+        for counts in reader:
+            tokens[pos:pos + len(counts)] = counts
+            pos += len(counts)
+            bar.update(len(counts))
+
+    idx.tokens = tokens
+    idx.save()
+    return idx
+
+
+def select_lines(idx, p_keep: float, seed) -> np.ndarray:
+    """Номера строк с токенами, прореженные с вероятностью p_keep (одним numpy-проходом)."""
+    keep = idx.tokens > 0
+    if p_keep < 1.0:
+        keep &= np.random.default_rng(seed).random(len(idx)) < p_keep
+    sel = np.flatnonzero(keep)
+    if corpus_io.LINE_LIMIT is not None:
+        sel = sel[sel < corpus_io.LINE_LIMIT]
+    return sel
+
+
+def _iter_selected(idx, sel, pool, deduper=None):
+    """
+    Поток (строка, токены) выбранных строк источника; токены — из индекса.
+    Ключи дедупликации считаются в пуле, в полёте не больше 2*WORKERS кусков
+    (ограниченная память, порядок сохраняется).
+    """
+    tokens = idx.tokens
+    items = (
+        (line if line.endswith("\n") else line + "\n", int(tokens[n]))
+        for n, line in idx.iter_lines(sel)
+    )
+    # чтение выбранных строк — в фоновом потоке, кусками по CHUNK_LINES
+    chunks = background(_chunks(items))
+    if deduper is None:
+        for chunk in chunks:
+            metrics.inc("records_in", len(chunk))
+            yield from chunk
+        return
+
+    pending = deque()
+
+    def results():
+        chunk, res = pending.popleft()
+        metrics.inc("records_in", len(chunk))
+        keep = deduper.check_keys(res.get())
+        kept = [item for item, k in zip(chunk, keep) if k]
+        metrics.inc("dedup_removed", len(chunk) - len(kept))
+        return kept
+
+    for chunk in chunks:
+        lines = [line for line, _ in chunk]
+        pending.append((chunk, pool.apply_async(_keys_chunk, (lines, deduper.mode))))
+        if len(pending) >= 2 * WORKERS:
+            yield from results()
+    while pending:
+        yield from results()
+
+
+# ==========================
+#   СМЕШИВАНИЕ
+# ==========================
+
+def plan_mix(totals, weights):
+    """
+    По числу токенов и весам источников вернуть (бюджеты токенов, вероятности выборки).
+    Самый «дефицитный» источник берётся целиком, остальные прореживаются под доли.
+    """
+    w_sum = sum(weights)
+    shares = [w / w_sum for w in weights]
+    mix_total = min(t / s for t, s in zip(totals, shares) if s > 0)
+    budgets = [s * mix_total for s in shares]
+    probs = [min(1.0, b / t * OVERSAMPLE) if t else 0.0 for b, t in zip(budgets, totals)]
+    return budgets, probs
 
 
 def main():
-    random.seed(42)
-
-    p_keep_os = estimate_keep_prob()
-
+    rng = random.Random(SEED)
     OUT_JSONL.parent.mkdir(parents=True, exist_ok=True)
 
-    os_tokens = 0
-    c4_tokens = 0
-
-    with OUT_JSONL.open("w", encoding="utf-8") as out:
-
-        # Sample OpenSubtitles
-        with OS_JSONL.open("r", encoding="utf-8") as f_os:
-            for line in tqdm(f_os, desc="sampling OpenSubtitles"):
-                if random.random() > p_keep_os:
-                    continue
-                obj = json.loads(line)
-                text = obj["text"]
-                if not text:
-                    continue
-                os_tokens += len(text.split())
-                out.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-        # Add whole C4
-        with C4_JSONL.open("r", encoding="utf-8") as f_c4:
-            for line in tqdm(f_c4, desc="adding C4"):
-                obj = json.loads(line)
-                text = obj["text"]
-                if not text:
-                    continue
-                c4_tokens += len(text.split())
-                out.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-    total = os_tokens + c4_tokens
+    paths = [p for p, _ in SOURCES]
+    weights = [w for _, w in SOURCES]
+    missing = [str(p) for p in paths if not p.exists()]
+    if missing:
+        raise FileNotFoundError(f"mix sources not found: {', '.join(missing)}")
+
+    with Pool(WORKERS) as pool:
+        indexes = [source_index(p, pool) for p in paths]
+        totals = [int(idx.tokens.sum()) for idx in indexes]
+        # пустой источник с ненулевой долей обнулил бы весь бюджет смеси
+        empty = [p.name for p, t, w in zip(paths, totals, weights) if w > 0 and t == 0]
+        if empty:
+            raise ValueError(f"mix sources without tokens (empty input?): {', '.join(empty)}")
+        budgets, probs = plan_mix(totals, weights)
+
+        for p, t, b, pk in zip(paths, totals, budgets, probs):
+            print(f"{p.name}: {t} tokens, budget {b:.0f}, keep prob {pk:.4f}")
+
+        sels = [select_lines(idx, pk, [SEED, zlib.crc32(p.name.encode())])
+                for p, idx, pk in zip(paths, indexes, probs)]
+        # таблица отпечатков — под число выбранных строк источника
+        dedupers = [Deduper(DEDUP[p.name], lines=len(sel)) if p.name in DEDUP else None
+                    for p, sel in zip(paths, sels)]
+        streams = [
+            _iter_selected(idx, sel, pool, d)
+            for idx, sel, d in zip(indexes, sels, dedupers)
+        ]
+        kept = [0] * len(streams)
+        active = [b > 0 for b in budgets]
+        buf = []
+        out_tokens = array("I")
+
+        with open_text(OUT_JSONL, "w", index=True) as out, \
+                tqdm(desc="mixing") as bar:
+            while any(active):
+                # берём источник, который сильнее всего отстаёт от своей доли
+                i = min((k for k in range(len(streams)) if active[k]),
+                        key=lambda k: kept[k] / budgets[k])
+                item = next(streams[i], None)
+                if item is None:
+                    # источник кончился — дальше доли разъедутся, останавливаемся
+                    break
+                line, n = item
+                kept[i] += n
+                metrics.inc("records_out")
+                metrics.inc("tokens_out", n)
+                if kept[i] >= budgets[i]:
+                    active[i] = False
+
+                if len(buf) < SHUFFLE_BUFFER:
+                    buf.append(item)
+                else:
+                    j = rng.randrange(SHUFFLE_BUFFER)
+                    out.write(buf[j][0])
+                    out_tokens.append(buf[j][1])
+                    buf[j] = item
+                bar.update()
+
+            rng.shuffle(buf)
+            for line, n in buf:
+                out.write(line)
+                out_tokens.append(n)
+
+    line_index.write_sidecar(OUT_JSONL, out_tokens)
+
+    for p, d in zip(paths, dedupers):
+        if d:
+            d.report(p.name)
+
+    total = sum(kept)
     print("-----")
-    print("OS tokens:", os_tokens)
-    print("C4 tokens:", c4_tokens)
-    print("Final OS share:", os_tokens / total)
-    print("Final C4 share:", c4_tokens / total)
+    for p, k in zip(paths, kept):
+        print(f"{p.name}: {k} tokens, share {k / total if total else 0.0:.4f}")
     print("Output:", OUT_JSONL.resolve())
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("mix"):
+        profiling.run(main, "mix", OUT_JSONL.parent, outputs=("OUT_JSONL",))
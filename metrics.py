@@ -0,0 +1,244 @@
+"""
+Структурированные метрики стадий.
+
+Включаются переменной окружения HABLAI_METRICS:
+- путь *.prom — Prometheus textfile (для node_exporter textfile collector);
+  у каждой стадии свой файл: metrics.prom -> metrics.<stage>.prom, перезаписывается атомарно;
+- любой другой путь — JSON lines, все стадии дописывают в один файл.
+HABLAI_METRICS_INTERVAL — период сэмплирования в секундах (по умолчанию 30).
+Без HABLAI_METRICS все вызовы — дешёвые no-op.
+
+В скрипте:
+
+    import metrics
+
+    with metrics.stage("count"):
+        ...
+        metrics.inc("records_in")
+        metrics.inc("spill_bytes", size)
+        metrics.gauge("merge_fan_in", len(files))
+        with metrics.timer("merge_seconds"):
+            ...
+        metrics.observe("llm_latency_seconds", dt)
+
+Каждый сэмпл содержит счётчики и их скорость с прошлого сэмпла, gauges,
+перцентили наблюдений (p50/p90/p99/max по последним RESERVOIR, count/sum — по всем),
+текущий и пиковый RSS и байты
+ввода-вывода процесса (/proc/self/io).
+"""
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_PATH = os.environ.get("HABLAI_METRICS")
+INTERVAL = float(os.environ.get("HABLAI_METRICS_INTERVAL", "30"))
+
+# сколько последних наблюдений хранить для перцентилей
+RESERVOIR = 10_000
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_io() -> dict:
+    """rchar/wchar (все read/write) и read_bytes/write_bytes (реально с/на диск)."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE / 2**20
+    except OSError:
+        return 0.0
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {}
+    s = sorted(values)
+
+    def q(p):
+        return s[min(len(s) - 1, int(p * len(s)))]
+
+    return {"count": len(values), "p50": q(0.50), "p90": q(0.90), "p99": q(0.99), "max": s[-1]}
+
+
+class StageMetrics:
+    """Метрики одной стадии + фоновый поток, периодически сбрасывающий сэмплы."""
+
+    def __init__(self, name: str, path: str, interval: float = INTERVAL):
+        self.name = name
+        self.path = Path(path)
+        self.prom = self.path.suffix == ".prom"
+        if self.prom:
+            self.path = self.path.with_name(f"{self.path.stem}.{name}.prom")
+        self.interval = interval
+        self.counters = {}
+        self.gauges = {}
+        self.observations = {}
+        self._obs_totals = {}  # key -> [число, сумма] всех наблюдений (для summary)
+        self.started = time.time()
+        self._last = (self.started, {})
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"metrics-{name}", daemon=True)
+
+    # ---- запись ----
+
+    def inc(self, key: str, value=1):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, key: str, value):
+        self.gauges[key] = value
+
+    def observe(self, key: str, value: float):
+        obs = self.observations.get(key)
+        if obs is None:
+            obs = self.observations[key] = []
+        obs.append(value)
+        totals = self._obs_totals.setdefault(key, [0, 0.0])
+        totals[0] += 1
+        totals[1] += value
+        if len(obs) > 2 * RESERVOIR:
+            del obs[:-RESERVOIR]
+
+    # ---- сэмплы ----
+
+    def snapshot(self, final: bool = False) -> dict:
+        now = time.time()
+        counters = dict(self.counters)
+        last_t, last_c = self._last
+        dt = max(now - last_t, 1e-9)
+        rates = {k: (v - last_c.get(k, 0)) / dt for k, v in counters.items()}
+        self._last = (now, counters)
+
+        return {
+            "stage": self.name,
+            "ts": round(now, 3),
+            "elapsed": round(now - self.started, 3),
+            "final": final,
+            "counters": counters,
+            "rates": rates,
+            "gauges": dict(self.gauges),
+            "observations": {k: self._summary(k, v) for k, v in list(self.observations.items())},
+            "rss_mb": round(_rss_mb(), 1),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "io": _proc_io(),
+        }
+
+    def _summary(self, key: str, values) -> dict:
+        """Перцентили по последним RESERVOIR наблюдениям + число и сумма всех."""
+        qs = _percentiles(values[-RESERVOIR:])
+        count, total = self._obs_totals.get(key, (0, 0.0))
+        qs["count"] = count
+        qs["sum"] = total
+        return qs
+
+    def _write(self, snap: dict):
+        if self.prom:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(self._prom_text(snap), encoding="utf-8")
+            tmp.replace(self.path)
+        else:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(snap, ensure_ascii=False) + "\n")
+
+    def _prom_text(self, snap: dict) -> str:
+        """Prometheus text format: # TYPE перед каждым семейством, квантили — 0.5/0.9/0.99."""
+        label = f'{{stage="{self.name}"}}'
+        lines = []
+
+        def family(name, kind, *samples):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        family("hablai_elapsed_seconds", "gauge", f"hablai_elapsed_seconds{label} {snap['elapsed']}")
+        family("hablai_rss_bytes", "gauge", f"hablai_rss_bytes{label} {snap['rss_mb'] * 2**20:.0f}")
+        family("hablai_peak_rss_bytes", "gauge",
+               f"hablai_peak_rss_bytes{label} {snap['peak_rss_mb'] * 2**20:.0f}")
+        for k, v in snap["io"].items():
+            family(f"hablai_io_{k}_total", "counter", f"hablai_io_{k}_total{label} {v}")
+        for k, v in snap["counters"].items():
+            family(f"hablai_{k}_total", "counter", f"hablai_{k}_total{label} {v}")
+            family(f"hablai_{k}_per_second", "gauge",
+                   f"hablai_{k}_per_second{label} {snap['rates'][k]:.3f}")
+        for k, v in snap["gauges"].items():
+            family(f"hablai_{k}", "gauge", f"hablai_{k}{label} {v}")
+        for k, qs in snap["observations"].items():
+            family(f"hablai_{k}", "summary",
+                   *(f'hablai_{k}{{stage="{self.name}",quantile="{q}"}} {qs[p]}'
+                     for q, p in (("0.5", "p50"), ("0.9", "p90"), ("0.99", "p99"))),
+                   f"hablai_{k}_sum{label} {qs['sum']}",
+                   f"hablai_{k}_count{label} {qs['count']}")
+        return "\n".join(lines) + "\n"
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._write(self.snapshot())
+
+    def start(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._write(self.snapshot(final=True))
+
+
+# ==========================
+#   ТЕКУЩАЯ СТАДИЯ
+# ==========================
+
+_current = None
+
+
+@contextmanager
+def stage(name: str):
+    """Включить метрики стадии на время блока (если задан HABLAI_METRICS)."""
+    global _current
+    if not METRICS_PATH or _current is not None:
+        yield _current
+        return
+    _current = StageMetrics(name, METRICS_PATH)
+    _current.start()
+    try:
+        yield _current
+    finally:
+        m, _current = _current, None
+        m.stop()
+
+
+def inc(key: str, value=1):
+    if _current is not None:
+        _current.inc(key, value)
+
+
+def gauge(key: str, value):
+    if _current is not None:
+        _current.gauge(key, value)
+
+
+def observe(key: str, value: float):
+    if _current is not None:
+        _current.observe(key, value)
+
+
+@contextmanager
+def timer(key: str):
+    """Замерить длительность блока как наблюдение key (секунды)."""
+    if _current is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current.observe(key, time.perf_counter() - t0)
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+"""
+Поисковое хранилище фраз поверх итогового phrase_index_llm_filtered.jsonl.
+
+Сборка компилирует jsonl в каталог STORE_DIR из плоских файлов, которые
+открываются через mmap (ничего не грузится в память целиком):
+- keys.bin + key_offsets.npy       — отсортированные ключи фраз (sorted string table);
+- records.bin + record_offsets.npy — исходные jsonl-записи в том же порядке;
+- freq.npy                         — freq_phrase в том же порядке;
+- words.bin + word_offsets.npy     — отсортированный словарь;
+- postings.npy + posting_offsets.npy — инвертированный индекс слово -> фразы,
+  списки отсортированы по убыванию freq_phrase (top-K — просто первые K);
+- prefixes.bin + prefix_offsets.npy + prefix_top.npy — для «тяжёлых» префиксов
+  (больше SCAN_LIMIT фраз: "", "d", "¿" -> "") заранее посчитанные top-MAX_K,
+  чтобы префиксный запрос никогда не сканировал больше SCAN_LIMIT строк.
+
+Ключ фразы — токены es_tokenizer в нижнем регистре без пунктуации через пробел,
+так что "¿Me puedes ayudar?" и "me puedes ayudar" совпадают.
+
+    python phrase_store.py                       # собрать STORE_DIR из PHRASE_INDEX
+    python phrase_store.py prefix "¿me pue"      # запросы из командной строки
+    python phrase_store.py exact "me puedes ayudar"
+    python phrase_store.py word ayudar -k 20
+    python phrase_store.py serve --port 8080     # HTTP: /prefix?q=..&k=.., /exact?q=.., /word?q=..&k=..
+
+Нагрузочный тест: python -m bench.loadtest (см. bench/loadtest.py).
+"""
+import argparse
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from tqdm import tqdm
+
+import line_index
+import metrics
+import profiling
+from codec import decode_phrase, dumps, loads
+from corpus_io import open_bytes
+from es_tokenizer import make_tokenizer
+
+# вход — итог LLM-фильтра
+PHRASE_INDEX = Path(
+    "/media/ol/SSD2T_Photo/hablai/corpus/jsonl/phrase_index_llm_filtered.jsonl"
+)
+# скомпилированное хранилище
+STORE_DIR = Path("corpus/phrase_store")
+
+# сколько результатов отдавать по умолчанию и максимум, который можно запросить
+TOP_K = 10
+MAX_K = 100
+
+# префиксы с большим числом фраз получают готовый top-MAX_K при сборке
+SCAN_LIMIT = 4096
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+_key_tokens = make_tokenizer(punct="drop", casefold=True)
+
+
+def phrase_key(text: str) -> str:
+    return " ".join(_key_tokens(text))
+
+
+def prefix_key(text: str) -> str:
+    """Ключ для префиксного поиска: пробел в конце запроса значит «слово закончено»."""
+    key = phrase_key(text)
+    if key and text[-1:].isspace():
+        key += " "
+    return key
+
+
+# ==========================
+#   СБОРКА
+# ==========================
+
+def _write_strings(items, count: int, bin_path: Path, offsets_path: Path):
+    """count байтовых строк подряд в bin_path + их смещения в offsets_path."""
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    pos = 0
+    with open(bin_path, "wb") as f:
+        for i, item in enumerate(items):
+            f.write(item)
+            pos += len(item)
+            offsets[i + 1] = pos
+    np.save(offsets_path, offsets)
+
+
+def _heavy_prefixes(keys: list, freq):
+    """
+    Все байтовые префиксы, под которые попадает больше SCAN_LIMIT ключей, и их
+    top-MAX_K (индексы ключей по убыванию freq). Обход от пустого префикса вглубь:
+    дочерние диапазоны находятся bisect-ом, в лёгкие диапазоны не спускаемся.
+    """
+    prefixes = []
+    tops = []
+    stack = [(b"", 0, len(keys))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        f = np.asarray(freq[lo:hi])
+        top = np.argpartition(-f, MAX_K)[:MAX_K]
+        prefixes.append(prefix)
+        tops.append(lo + top[np.argsort(-f[top], kind="stable")])
+
+        depth = len(prefix)
+        i = lo
+        while i < hi and len(keys[i]) == depth:  # сам ключ, равный префиксу, идёт первым
+            i += 1
+        while i < hi:
+            b = keys[i][depth]
+            j = hi if b == 0xff else bisect_left(keys, prefix + bytes([b + 1]), i, hi)
+            if j - i > SCAN_LIMIT:
+                stack.append((prefix + bytes([b]), i, j))
+            i = j
+
+    order = sorted(range(len(prefixes)), key=prefixes.__getitem__)
+    top = np.array([tops[i] for i in order], dtype=np.uint64).reshape(len(order), MAX_K)
+    return [prefixes[i] for i in order], top
+
+
+def build(src: Path = PHRASE_INDEX, out_dir: Path = STORE_DIR):
+    idx = line_index.load(src)
+    if not idx.seekable:
+        raise ValueError(f"{src}: phrase store is built from an uncompressed jsonl")
+
+    keys = []
+    rows = array("Q")
+    freqs = array("q")
+    with open_bytes(src) as f:
+        for n, line in enumerate(tqdm(f, total=len(idx), desc="reading phrases")):
+            if not line.strip():
+                continue
+            rec = decode_phrase(line)
+            key = phrase_key(rec.phrase)
+            if not key:
+                continue
+            keys.append(key.encode("utf-8"))
+            rows.append(n)
+            freqs.append(rec.freq_phrase)
+            metrics.inc("records_in")
+
+    print(f"Sorting {len(keys)} phrases...")
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    keys = [keys[i] for i in order]
+    rows = np.frombuffer(rows, dtype=np.uint64)[order]
+    freq = np.frombuffer(freqs, dtype=np.int64)[order]
+
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    _write_strings(keys, len(keys), tmp / "keys.bin", tmp / "key_offsets.npy")
+    np.save(tmp / "freq.npy", freq)
+
+    prefixes, prefix_top = _heavy_prefixes(keys, freq) if len(keys) > SCAN_LIMIT else ([], None)
+    _write_strings(prefixes, len(prefixes), tmp / "prefixes.bin", tmp / "prefix_offsets.npy")
+    np.save(tmp / "prefix_top.npy",
+            prefix_top if prefix_top is not None else np.zeros((0, MAX_K), dtype=np.uint64))
+
+    # записи — байты исходных строк в порядке ключей
+    off = idx.offsets
+    with open(src, "rb") as f_in, \
+            mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        records = (mm[int(off[r]):int(off[r + 1])] for r in rows)
+        _write_strings(tqdm(records, total=len(rows), desc="writing records"), len(rows),
+                       tmp / "records.bin", tmp / "record_offsets.npy")
+
+    # инвертированный индекс: пары (слово, фраза) -> сортировка по слову, затем по частоте
+    vocab = {}
+    pair_words = array("I")
+    pair_phrases = array("I")
+    for pid, key in enumerate(tqdm(keys, desc="inverting")):
+        for w in dict.fromkeys(key.split(b" ")):
+            pair_words.append(vocab.setdefault(w, len(vocab)))
+            pair_phrases.append(pid)
+
+    words = sorted(vocab)
+    rank = np.empty(len(words), dtype=np.uint32)
+    rank[[vocab[w] for w in words]] = np.arange(len(words), dtype=np.uint32)
+    pw = rank[np.frombuffer(pair_words, dtype=np.uint32)]
+    pp = np.frombuffer(pair_phrases, dtype=np.uint32)
+    by_word = np.lexsort((-freq[pp], pw))
+
+    _write_strings(words, len(words), tmp / "words.bin", tmp / "word_offsets.npy")
+    np.save(tmp / "postings.npy", pp[by_word])
+    posting_offsets = np.zeros(len(words) + 1, dtype=np.uint64)
+    np.cumsum(np.bincount(pw, minlength=len(words)), out=posting_offsets[1:])
+    np.save(tmp / "posting_offsets.npy", posting_offsets)
+
+    meta = {"source": str(src), "phrases": len(keys), "words": len(words),
+            "heavy_prefixes": len(prefixes), "scan_limit": SCAN_LIMIT, "max_k": MAX_K}
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    tmp.rename(out_dir)
+    metrics.inc("records_out", len(keys))
+    print(f"Phrase store: {len(keys)} phrases, {len(words)} words -> {out_dir.resolve()}")
+
+
+# ==========================
+#   ЧТЕНИЕ
+# ==========================
+
+class _Strings:
+    """Последовательность байтовых строк поверх mmap (годится для bisect)."""
+
+    def __init__(self, bin_path: Path, offsets_path: Path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self._mm = b""
+        if os.path.getsize(bin_path):  # пустой файл mmap не открывает
+            with open(bin_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._mm[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+
+class PhraseStore:
+    def __init__(self, path: Path = STORE_DIR):
+        path = Path(path)
+        self.keys = _Strings(path / "keys.bin", path / "key_offsets.npy")
+        self.records = _Strings(path / "records.bin", path / "record_offsets.npy")
+        self.freq = np.load(path / "freq.npy", mmap_mode="r")
+        self.words = _Strings(path / "words.bin", path / "word_offsets.npy")
+        self.postings = np.load(path / "postings.npy", mmap_mode="r")
+        self.posting_offsets = np.load(path / "posting_offsets.npy", mmap_mode="r")
+        self.prefixes = _Strings(path / "prefixes.bin", path / "prefix_offsets.npy")
+        self.prefix_top = np.load(path / "prefix_top.npy", mmap_mode="r")
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        self.scan_limit = meta["scan_limit"]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _records(self, ids) -> list:
+        return [loads(self.records[int(i)]) for i in ids]
+
+    def exact(self, phrase: str) -> list:
+        """Все записи с тем же ключом, что и phrase."""
+        key = phrase_key(phrase).encode("utf-8")
+        if not key:
+            return []
+        lo = bisect_left(self.keys, key)
+        hi = bisect_right(self.keys, key, lo)
+        return self._records(range(lo, hi))
+
+    def prefix(self, text: str, k: int = TOP_K) -> list:
+        """Top-k по freq_phrase среди фраз, ключ которых начинается с ключа запроса."""
+        key = prefix_key(text).encode("utf-8")
+        lo = bisect_left(self.keys, key)
+        # в utf-8 нет байта 0xff — верхняя граница всех строк с этим префиксом
+        hi = bisect_left(self.keys, key + b"\xff", lo)
+        if hi - lo > self.scan_limit:
+            # тяжёлый префикс — готовый top-MAX_K со сборки
+            i = bisect_left(self.prefixes, key)
+            if i < len(self.prefixes) and self.prefixes[i] == key:
+                return self._records(self.prefix_top[i, :k])
+        if hi - lo <= k:
+            ids = lo + np.argsort(-self.freq[lo:hi], kind="stable")
+        else:
+            f = np.asarray(self.freq[lo:hi])
+            top = np.argpartition(-f, k)[:k]
+            ids = lo + top[np.argsort(-f[top], kind="stable")]
+        return self._records(ids)
+
+    def by_word(self, word: str, k: int = TOP_K) -> list:
+        """Top-k по freq_phrase среди фраз, содержащих слово."""
+        key = phrase_key(word).encode("utf-8")
+        i = bisect_left(self.words, key)
+        if not key or i >= len(self.words) or self.words[i] != key:
+            return []
+        a = int(self.posting_offsets[i])
+        b = min(int(self.posting_offsets[i + 1]), a + k)
+        return self._records(self.postings[a:b])
+
+    def query(self, kind: str, q: str, k: int = TOP_K) -> list:
+        if not 1 <= k <= MAX_K:
+            raise ValueError(f"k must be in 1..{MAX_K}, got {k}")
+        if kind == "exact":
+            return self.exact(q)
+        if kind == "prefix":
+            return self.prefix(q, k)
+        if kind == "word":
+            return self.by_word(q, k)
+        raise ValueError(f"unknown query kind: {kind!r}")
+
+
+# ==========================
+#   HTTP
+# ==========================
+
+def serve(store: PhraseStore, host: str = HOST, port: int = PORT):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        disable_nagle_algorithm = True  # иначе заголовки и тело ждут delayed ACK (~40 мс)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            q = params.get("q", [""])[0]
+            t0 = time.perf_counter()
+            try:
+                k = int(params.get("k", [TOP_K])[0])
+                results = store.query(url.path.strip("/"), q, k)
+                status = 200
+                body = {"results": results}
+            except ValueError as e:
+                status = 400
+                body = {"error": str(e)}
+            body["took_us"] = round((time.perf_counter() - t0) * 1e6)
+
+            data = dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving {len(store)} phrases on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="phrase store: build / query / serve")
+    ap.add_argument("command", nargs="?", default="build",
+                    choices=["build", "serve", "prefix", "exact", "word"])
+    ap.add_argument("query", nargs="?", default="")
+    ap.add_argument("-k", type=int, default=TOP_K)
+    ap.add_argument("--store", type=Path, default=STORE_DIR)
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    args, _ = ap.parse_known_args()
+
+    if args.command == "build":
+        with metrics.stage("phrase_store"):
+            profiling.run(lambda: build(PHRASE_INDEX, profiling.scratch(args.store)),
+                          "phrase_store", args.store.parent)
+        return
+
+    store = PhraseStore(args.store)
+    if args.command == "serve":
+        serve(store, args.host, args.port)
+        return
+
+    t0 = time.perf_counter()
+    results = store.query(args.command, args.query, args.k)
+    took = (time.perf_counter() - t0) * 1e6
+    for rec in results:
+        print(rec.get("freq_phrase"), rec.get("phrase"), sep="\t")
+    print(f"{len(results)} results in {took:.0f} µs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Упреждающее чтение корпусов: I/O и распаковка — в фоновом потоке,
+декодирование — в пуле процессов (или в том же фоновом потоке), основной цикл
+получает уже готовые батчи через ограниченную очередь.
+
+    with PrefetchReader(path, decode_texts, pool) as reader:
+        for texts in reader:          # батч = результат decode(блок строк)
+            ...
+            reader.lines              # сколько строк файла уже отдано
+
+Файл читается блоками по BLOCK_SIZE байт, блок режется по последнему переводу
+строки (хвост переносится в следующий). В очереди не больше DEPTH блоков,
+поэтому память ограничена, а порядок батчей совпадает с порядком строк.
+decode должен быть функцией верхнего уровня (её выполняют процессы пула).
+Ограничение corpus_io.LINE_LIMIT (режим --profile) соблюдается.
+
+INLINE (выставляет profiling.run в режиме --profile) отключает фоновый поток и пул:
+чтение и декодирование идут в основном потоке, иначе профайлер их не видит.
+
+background(iterable) — то же для произвольного итератора: он крутится
+в фоновом потоке на DEPTH элементов вперёд.
+"""
+import queue
+import threading
+from pathlib import Path
+
+import corpus_io
+from codec import decode_count, decode_text
+from corpus_io import open_bytes
+
+# Размер блока чтения и глубина очереди (в блоках)
+BLOCK_SIZE = 8 << 20
+DEPTH = 8
+# читать и декодировать в вызывающем потоке (режим --profile)
+INLINE = False
+
+_END = object()
+
+
+# ==========================
+#   ДЕКОДЕРЫ
+# ==========================
+
+def split_lines(block: bytes) -> list:
+    """Строки блока (bytes, без перевода строки), по одной на каждую строку файла."""
+    lines = block.split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def decode_texts(block: bytes) -> list:
+    """Поле "text" непустых строк корпусного jsonl."""
+    return [decode_text(line) for line in split_lines(block) if line.strip()]
+
+
+def decode_counts(block: bytes) -> list:
+    """(text, count) строк freq_*.jsonl."""
+    return [decode_count(line) for line in split_lines(block) if line.strip()]
+
+
+# ==========================
+#   ФОНОВЫЙ ПОТОК
+# ==========================
+
+class _Worker:
+    """Фоновый поток, складывающий элементы генератора в ограниченную очередь."""
+
+    def __init__(self, produce, name: str, depth: int):
+        self._produce = produce
+        self._q = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for item in self._produce():
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self._error = e
+        self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self._q.get()
+            if item is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def close(self):
+        self._stop.set()
+        while True:
+            try:
+                self._q.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join()
+
+
+class _Inline:
+    """Тот же интерфейс, что у _Worker, но генератор крутится в вызывающем потоке."""
+
+    def __init__(self, produce):
+        self._it = produce()
+
+    def __iter__(self):
+        yield from self._it
+
+    def close(self):
+        self._it.close()
+
+
+def background(iterable, depth: int = DEPTH):
+    """Итерировать iterable в фоновом потоке на depth элементов вперёд."""
+    if INLINE:
+        yield from iterable
+        return
+    worker = _Worker(lambda: iter(iterable), "prefetch-iter", depth)
+    try:
+        yield from worker
+    finally:
+        worker.close()
+
+
+class PrefetchReader:
+    def __init__(self, path, decode=split_lines, pool=None,
+                 block_size: int = BLOCK_SIZE, depth: int = DEPTH, respect_limit: bool = True):
+        """
+        decode(block: bytes) -> батч; pool — multiprocessing.Pool для декодирования
+        (None — декодировать в фоновом потоке чтения); depth — блоков в полёте
+        (с пулом стоит брать не меньше 2 * число процессов);
+        respect_limit=False — читать файл целиком даже при --profile.
+        При INLINE пул и фоновый поток не используются.
+        """
+        self.path = Path(path)
+        self.decode = decode
+        self.pool = None if INLINE else pool
+        self.block_size = block_size
+        self.limit = corpus_io.LINE_LIMIT if respect_limit else None
+        self.lines = 0
+        if INLINE:
+            self._worker = _Inline(self._produce)
+        else:
+            self._worker = _Worker(self._produce, f"prefetch-{self.path.name}", depth)
+
+    def _blocks(self):
+        """(число строк, блок целых строк) подряд по файлу."""
+        limit = self.limit
+        seen = 0
+        tail = b""
+        with open_bytes(self.path) as f:
+            while True:
+                buf = f.read(self.block_size)
+                if not buf:
+                    break
+                if tail:
+                    buf = tail + buf
+                cut = buf.rfind(b"\n") + 1
+                if not cut:
+                    tail = buf
+                    continue
+                block, tail = buf[:cut], buf[cut:]
+                n = block.count(b"\n")
+                if limit is not None and seen + n >= limit:
+                    pos = -1
+                    for _ in range(limit - seen):
+                        pos = block.index(b"\n", pos + 1)
+                    yield limit - seen, block[:pos + 1]
+                    return
+                seen += n
+                yield n, block
+        if tail and (limit is None or seen < limit):
+            yield 1, tail
+
+    def _produce(self):
+        for n, block in self._blocks():
+            if self.pool is not None:
+                yield n, self.pool.apply_async(self.decode, (block,))
+            else:
+                yield n, self.decode(block)
+
+    def __iter__(self):
+        for n, batch in self._worker:
+            if self.pool is not None:
+                batch = batch.get()
+            self.lines += n
+            yield batch
+
+    def close(self):
+        self._worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
-import json
+import os
 import re
+from multiprocessing import Pool
 from pathlib import Path
 
 from tqdm import tqdm
 
+import line_index
+import metrics
+import profiling
+import shards
+from codec import dumps_line, loads
+from corpus_io import open_text
+from es_tokenizer import tokenize
+
 # ==========================
 #   ПУТИ
 # ==========================
@@ -17,15 +26,15 @@ PHRASE_INDEX_OUT = Path(
     "/media/ol/SSD2T_Photo/hablai/corpus/jsonl/phrase_index_prefiltered.jsonl"
 )
 
+# шардированный вход (манифест) фильтруется в пуле, по шарду на задачу
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
 # ==========================
 #   ПРЕФИЛЬТР
 # ==========================
 
 _ES_LETTERS = set("abcdefghijklmnñopqrstuvwxyzáéíóúü")
 
-# набор символов, считающихся «чистой пунктуацией»
-_PUNCT_CHARS = set("!¡?¿.,;:()[]{}«»\"'-")
-
 
 def _es_like(word: str) -> bool:
     """
@@ -90,22 +99,14 @@ def simple_prefilter(rec: dict) -> bool:
     # записываем очищенную фразу обратно
     rec["phrase"] = phrase
 
-    tokens = phrase.split()
+    # токены без пунктуации (es_tokenizer, режим drop)
+    tokens = tokenize(phrase)
     n_eff = len(tokens)
 
     # базовая длина по словам — уже по очищенному тексту
     if n_eff < 2 or n_eff > 5:
         return False
 
-    lower_tokens = [t.lower() for t in tokens]
-
-    # если слишком много "чисто пунктуационных" токенов — отбрасываем
-    punct_tokens = sum(
-        1 for t in tokens if all(ch in _PUNCT_CHARS for ch in t)
-    )
-    if punct_tokens / n_eff > 0.4:
-        return False
-
     # 1. URL, почта, домены
     if "http://" in phrase or "https://" in phrase or "www." in phrase:
         return False
@@ -133,32 +134,10 @@ def simple_prefilter(rec: dict) -> bool:
 
     # 6. Полностью из "шумовых" служебных слов
     noise_words = {"por", "se", "de", "y", "yo", "te", "la", "el", "al", "en", "lo", "que"}
-    if all(t.lower().strip("¡!¿?.,") in noise_words for t in tokens):
-        return False
-
-    # 7. Начало с ¡/¿ и без типичного глагола → скорее мусор
-    common_verbs = {
-        "es", "está", "estoy", "eres", "soy", "somos", "son",
-        "quiero", "quieres", "quiere", "quieren",
-        "tengo", "tienes", "tiene", "tenemos",
-        "puedo", "puedes", "puede", "podemos",
-        "vamos", "voy", "ven", "venga",
-        "dime", "di", "haz", "ve",
-        "mira", "pienso", "creo", "sabes", "sabe",
-        "habla", "hablo", "hable", "hablemos",
-        "déjame", "déjate",
-    }
-
-    def has_common_verb() -> bool:
-        for t in lower_tokens:
-            if t.strip("¡!¿?.,;:()[]{}\"'«»") in common_verbs:
-                return True
-        return False
-
-    if phrase.startswith(("¡", "¿")) and not has_common_verb():
+    if all(t.lower() in noise_words for t in tokens):
         return False
 
-    # 8. Проверка "похожести на испанский"
+    # 7. Проверка "похожести на испанский"
     es_like_count = 0
     es_total = 0
     for t in tokens:
@@ -172,21 +151,45 @@ def simple_prefilter(rec: dict) -> bool:
     return True
 
 
-def main():
-    PHRASE_INDEX_OUT.parent.mkdir(parents=True, exist_ok=True)
-
+def prefilter_file(inp_path: Path, out_path: Path):
+    """Один файл индекса -> отфильтрованный файл; вернуть (всего, оставлено)."""
     total = 0
     kept = 0
 
-    with PHRASE_INDEX_IN.open("r", encoding="utf-8") as inp, \
-            PHRASE_INDEX_OUT.open("w", encoding="utf-8") as out:
+    with open_text(inp_path) as inp, \
+            open_text(out_path, "w", index=True) as out:
 
-        for line in tqdm(inp, desc="prefiltering phrase_index"):
+        for line in tqdm(inp, desc=f"prefiltering {inp_path.name}"):
             total += 1
-            rec = json.loads(line)
+            metrics.inc("records_in")
+            rec = loads(line)
             if simple_prefilter(rec):
                 kept += 1
-                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                metrics.inc("records_out")
+                out.write(dumps_line(rec))
+    line_index.write_sidecar(out_path)
+
+    return total, kept
+
+
+def main():
+    PHRASE_INDEX_OUT.parent.mkdir(parents=True, exist_ok=True)
+    shards.clear(PHRASE_INDEX_OUT)
+
+    parts = shards.parts(PHRASE_INDEX_IN)
+    if len(parts) == 1:
+        total, kept = prefilter_file(parts[0], PHRASE_INDEX_OUT)
+    else:
+        # шардированный индекс -> шарды результата в пуле + манифест
+        n = len(parts)
+        files = [shards.shard_path(PHRASE_INDEX_OUT, i, n) for i in range(n)]
+        with Pool(min(WORKERS, n)) as pool:
+            results = pool.starmap(prefilter_file, zip(parts, files))
+        total = sum(t for t, _ in results)
+        kept = sum(k for _, k in results)
+        metrics.inc("records_in", total)
+        metrics.inc("records_out", kept)
+        shards.write_manifest(PHRASE_INDEX_OUT, files, [k for _, k in results])
 
     print("Prefilter done.")
     print(f"Total records: {total}")
@@ -194,4 +197,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("prefilter"):
+        profiling.run(main, "prefilter", PHRASE_INDEX_OUT.parent, outputs=("PHRASE_INDEX_OUT",))
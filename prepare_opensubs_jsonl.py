@@ -1,30 +1,203 @@
-import json
+import os
+import re
+from collections import deque
+from multiprocessing import Pool
 from pathlib import Path
 
+import numpy as np
+from tqdm import tqdm
+
+import corpus_io
+import line_index
+import metrics
+import profiling
+from codec import dumps
+from corpus_io import compression, open_text
+
 INPUT_TXT = Path("corpus/opensubs2024_es/es.txt")
 OUTPUT_JSONL = Path("corpus/jsonl/opensubs_es.jsonl")
 
+# Выкидывать точные повторы строк (без учёта регистра и пробелов)
+DEDUP = False
+DEDUP_BATCH = 200_000
 
-def main():
-    OUTPUT_JSONL.parent.mkdir(parents=True, exist_ok=True)
+# Параллельная конвертация несжатого входа кусками по CHUNK_BYTES
+# (WORKERS = 1 — последовательный проход)
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+CHUNK_BYTES = 64 << 20
+
+
+def make_record(i: int, line: str) -> str:
+    # то же, что dumps_line({"id": f"os_{i}", "source": "opensubs", "text": line}),
+    # но без словаря: сериализуется только текст — заметно дешевле на сотнях миллионов строк
+    return f'{{"id":"os_{i}","source":"opensubs","text":{dumps(line)}}}\n'
+
+
+# ==========================
+#   ПОСЛЕДОВАТЕЛЬНО
+# ==========================
+
+def convert_sequential(deduper):
+    with open_text(INPUT_TXT, errors="ignore") as inp, \
+         open_text(OUTPUT_JSONL, "w", index=True) as out:
 
-    with INPUT_TXT.open("r", encoding="utf-8", errors="ignore") as inp, \
-         OUTPUT_JSONL.open("w", encoding="utf-8") as out:
+        batch = []  # (i, line)
+
+        def flush():
+            keep = deduper.filter([line for _, line in batch]) if deduper else None
+            for k, (i, line) in enumerate(batch):
+                if keep is not None and not keep[k]:
+                    continue
+                out.write(make_record(i, line))
+                metrics.inc("records_out")
+            batch.clear()
 
         for i, line in enumerate(inp):
+            metrics.inc("records_in")
             line = line.strip()
             if not line:
                 continue
 
-            obj = {
-                "id": f"os_{i}",
-                "source": "opensubs",
-                "text": line,
-            }
-            out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+            batch.append((i, line))
+            if len(batch) >= DEDUP_BATCH:
+                flush()
+
+        flush()
+
+
+# ==========================
+#   ПАРАЛЛЕЛЬНО
+# ==========================
+#
+# id = os_{номер строки}, причём нумеруются все строки, включая пустые, а текстовый
+# режим open_text делит строки по \n, \r и \r\n. Поэтому:
+# 1) файл режется на куски по CHUNK_BYTES, границы сдвигаются за ближайший \n;
+# 2) родитель читает каждый кусок один раз и считает в нём строки прямо по байтам —
+#    префиксные суммы дают номер первой строки следующего куска;
+# 3) байты куска уходят воркеру, он декодирует и конвертирует его с этим номером;
+#    в полёте не больше 2*WORKERS кусков, родитель пишет результаты по порядку
+#    (и, если включён DEDUP, фильтрует повторы по ключам, посчитанным в воркерах).
+
+# \r, за которым до \n идут только не-ASCII байты: если все они битые, errors="ignore"
+# их выкинет и \r + \n станут одним переводом строки "\r\n"
+_RE_CR_JUNK_LF = re.compile(rb"\r([\x80-\xff]+)\n")
+
+
+def chunk_ranges(path: Path, chunk_bytes: int) -> list:
+    """[(start, end)] кусков файла, каждый кончается сразу после \\n (или в конце файла)."""
+    size = path.stat().st_size
+    bounds = [0]
+    with open(path, "rb") as f:
+        while bounds[-1] < size:
+            f.seek(min(bounds[-1] + chunk_bytes, size))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    return list(zip(bounds, bounds[1:]))
+
+
+def count_lines(data: bytes) -> int:
+    """
+    Число строк куска в смысле текстового режима (\\n, \\r, \\r\\n) после
+    декодирования с errors="ignore" — без декодирования. Кусок кончается на \\n
+    или концом файла, поэтому \\r\\n через границу кусков не разрывается.
+    """
+    n = data.count(b"\n") + data.count(b"\r") - data.count(b"\r\n")
+    if b"\r" in data:
+        # \r и \n — ASCII, декодер между ними начинает с чистого состояния
+        for m in _RE_CR_JUNK_LF.finditer(data):
+            if not m.group(1).decode("utf-8", errors="ignore"):
+                n -= 1
+    return n
+
+
+def _convert_chunk(task):
+    """
+    (байты куска, номер первой строки, режим dedup) ->
+    (число строк, записи одним куском utf-8, концы записей в нём, ключи dedup).
+    Записи отдаются байтами: так их пересылка из воркера почти бесплатна.
+    """
+    data, first, dedup_mode = task
+    text = data.decode("utf-8", errors="ignore")
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    if lines[-1] == "":
+        lines.pop()  # после завершающего перевода строки строки нет
+
+    ids = []
+    texts = []
+    for i, line in enumerate(lines, first):
+        line = line.strip()
+        if line:
+            ids.append(i)
+            texts.append(line)
+
+    records = [make_record(i, line).encode("utf-8") for i, line in zip(ids, texts)]
+    ends = np.cumsum([len(r) for r in records], dtype=np.int64)
+    keys = None
+    if dedup_mode is not None:
+        from dedup import dedup_keys
+        keys = dedup_keys(dedup_mode, texts)
+    return len(lines), b"".join(records), ends, keys
+
+
+def convert_parallel(deduper):
+    ranges = chunk_ranges(INPUT_TXT, CHUNK_BYTES)
+    print(f"{INPUT_TXT.name}: {len(ranges)} chunks, {WORKERS} workers")
+    mode = deduper.mode if deduper else None
+
+    with Pool(WORKERS) as pool, \
+            open(INPUT_TXT, "rb") as inp, \
+            open_text(OUTPUT_JSONL, "w", index=True) as out:
+        # куски уже в utf-8 — пишем мимо текстового слоя
+        raw = out.buffer
+        pending = deque()
+        bar = tqdm(total=len(ranges), desc="converting")
+
+        def write_next():
+            n, data, ends, keys = pending.popleft().get()
+            kept = len(ends)
+            if keys is not None:
+                keep = deduper.check_keys(keys)
+                starts = np.concatenate(([0], ends[:-1]))
+                data = b"".join(data[a:b] for a, b in zip(starts[keep], ends[keep]))
+                kept = int(keep.sum())
+            raw.write(data)
+            metrics.inc("records_in", n)
+            metrics.inc("records_out", kept)
+            metrics.inc("chunks")
+            bar.update()
+
+        first = 0
+        for start, end in ranges:
+            data = inp.read(end - start)
+            pending.append(pool.apply_async(_convert_chunk, ((data, first, mode),)))
+            first += count_lines(data)
+            if len(pending) >= 2 * WORKERS:
+                write_next()
+        while pending:
+            write_next()
+        bar.close()
+
+
+def main():
+    OUTPUT_JSONL.parent.mkdir(parents=True, exist_ok=True)
+
+    deduper = None
+    if DEDUP:
+        from dedup import Deduper
+        deduper = Deduper("exact")
+
+    # куски по байтам возможны только в несжатом файле; --profile читает первые N строк
+    if WORKERS > 1 and not compression(INPUT_TXT) and corpus_io.LINE_LIMIT is None:
+        convert_parallel(deduper)
+    else:
+        convert_sequential(deduper)
 
+    line_index.write_sidecar(OUTPUT_JSONL)
+    if deduper:
+        deduper.report(INPUT_TXT.name)
     print("Wrote:", OUTPUT_JSONL.resolve())
 
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("prepare_opensubs"):
+        profiling.run(main, "prepare_opensubs", OUTPUT_JSONL.parent, outputs=("OUTPUT_JSONL",))
@@ -0,0 +1,178 @@
+"""
+Режим профилирования для всех скриптов пайплайна.
+
+    python count_ngrams_external.py --profile [--profile-lines 1000000] [--profile-cprofile]
+
+С --profile стадия идёт на ограниченном префиксе входа (все чтения через
+corpus_io.open_text обрезаются до --profile-lines строк) под профайлером:
+pyinstrument (семплирующий, малые накладные расходы), если установлен, иначе cProfile.
+Параллельно включается tracemalloc; snapshot(label) в горячих точках (spill-ы
+счётчика) сохраняет снимок памяти. Отчёт: <out_dir>/profile/<stage>.profile.txt —
+время по функциям и аллокации по строкам кода.
+
+Настоящие артефакты в режиме --profile не трогаются: константы-пути выходов стадии
+(outputs в run(), включая чекпоинты) подменяются на <каталог>/profile/<имя> — туда же
+пишутся усечённые результаты; их прошлые копии удаляются перед запуском, так что
+стадия всегда стартует с нуля. Входы читаются как обычно. Внешние вызовы стадии
+(LLM-запросы в filter_phrases_llm) выполняются — ограничены --profile-lines.
+
+Фоновое чтение prefetch.py в этом режиме выключается (prefetch.INLINE): профайлеры
+видят только вызывающий поток, а распаковка и разбор JSON — основная цена чтения.
+
+Без --profile run() просто вызывает main().
+"""
+import argparse
+import cProfile
+import io
+import importlib
+import pstats
+import shutil
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import corpus_io
+import prefetch
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+PROFILE_LINES = 1_000_000
+TOP_FUNCTIONS = 40
+TOP_ALLOCS = 15
+
+# готовые секции отчёта по памяти и предыдущий снимок (для прироста)
+_alloc_sections = []
+_last_snapshot = None
+# активный профайлер: (pause, resume) — разбор снимка не должен попадать в профиль
+_profiler_ctl = None
+# включается run() в режиме --profile: scratch() уводит выходы в profile/
+_active = False
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(add_help=False)
+    ap.add_argument("--profile", action="store_true")
+    ap.add_argument("--profile-lines", type=int, default=PROFILE_LINES)
+    ap.add_argument("--profile-cprofile", action="store_true")
+    args, _ = ap.parse_known_args(sys.argv[1:])
+    return args
+
+
+def scratch(path):
+    """
+    Путь выхода с учётом режима: в --profile — <каталог>/profile/<имя>,
+    иначе сам path. Для путей, которые стадия берёт не из констант модуля (--store).
+    """
+    if not _active or path is None:
+        return path
+    path = Path(path)
+    return path.parent / "profile" / path.name
+
+
+def _redirect(main, outputs):
+    """
+    Подменить константы-пути выходов на scratch()-пути и убрать их прошлые копии.
+    Имя "module.NAME" — константа другого модуля (читается стадией при вызове).
+    """
+    for name in outputs:
+        if "." in name:
+            mod, name = name.rsplit(".", 1)
+            namespace = vars(importlib.import_module(mod))
+        else:
+            namespace = main.__globals__
+        target = scratch(namespace[name])
+        if target is None:
+            continue
+        if target.is_dir():
+            shutil.rmtree(target)
+        else:
+            target.unlink(missing_ok=True)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        namespace[name] = target
+
+
+def snapshot(label: str):
+    """
+    Снимок памяти (только в режиме --profile): топ аллокаций по строкам кода
+    и прирост с предыдущего снимка. Хранится только последний снимок.
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return
+    if _profiler_ctl is not None:
+        _profiler_ctl[0]()
+    snap = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"--- snapshot '{label}': {current / 2**20:.1f} MiB traced, peak {peak / 2**20:.1f} MiB"]
+    for stat in snap.statistics("lineno")[:TOP_ALLOCS]:
+        lines.append(f"{stat.size / 2**20:9.2f} MiB {stat.count:>10d} blocks  {stat.traceback}")
+    if _last_snapshot is not None:
+        lines.append("  growth since previous snapshot:")
+        for stat in snap.compare_to(_last_snapshot, "lineno")[:TOP_ALLOCS // 2]:
+            lines.append(f"  {stat.size_diff / 2**20:+9.2f} MiB  {stat.traceback}")
+    _alloc_sections.append("\n".join(lines))
+    _last_snapshot = snap
+    if _profiler_ctl is not None:
+        _profiler_ctl[1]()
+
+
+def run(main, stage: str, out_dir: Path, outputs=()):
+    """
+    Запустить main() — обычным образом или под профайлером (--profile).
+    outputs — имена констант-путей, которые стадия пишет (см. scratch()).
+    """
+    global _profiler_ctl, _active
+    args = _parse_args()
+    if not args.profile:
+        return main()
+
+    _active = True
+    corpus_io.LINE_LIMIT = args.profile_lines
+    prefetch.INLINE = True
+    _redirect(main, outputs)
+    out_dir = Path(out_dir) / "profile"
+    print(f"[profile] {stage}: first {args.profile_lines} lines of each input, outputs -> {out_dir}")
+
+    tracemalloc.start()
+    use_sampler = Profiler is not None and not args.profile_cprofile
+    t0 = time.perf_counter()
+    if use_sampler:
+        # pyinstrument склеивает сессии между stop() и повторным start()
+        prof = Profiler(interval=0.001)
+        _profiler_ctl = (prof.stop, prof.start)
+    else:
+        prof = cProfile.Profile()
+        _profiler_ctl = (prof.disable, prof.enable)
+    _profiler_ctl[1]()
+
+    try:
+        main()
+    finally:
+        _profiler_ctl[0]()
+        _profiler_ctl = None
+        elapsed = time.perf_counter() - t0
+        snapshot("end")
+        tracemalloc.stop()
+
+        out = io.StringIO()
+        out.write(f"stage: {stage}\nlines limit: {args.profile_lines}\n"
+                  f"wall time (incl. snapshots): {elapsed:.2f}s\nprofiler: {'pyinstrument' if use_sampler else 'cProfile'}\n\n")
+        if use_sampler:
+            out.write(prof.output_text(unicode=True, color=False))
+        else:
+            for key in ("tottime", "cumulative"):
+                out.write(f"===== top {TOP_FUNCTIONS} by {key} =====\n")
+                pstats.Stats(prof, stream=out).strip_dirs().sort_stats(key).print_stats(TOP_FUNCTIONS)
+        out.write("\n\n===== tracemalloc =====\n\n")
+        out.write("\n\n".join(_alloc_sections) + "\n")
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        report = out_dir / f"{stage}.profile.txt"
+        report.write_text(out.getvalue(), encoding="utf-8")
+        print("[profile] report written to:", report.resolve())
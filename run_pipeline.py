@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+"""
+Единая точка запуска пайплайна с кешированием стадий.
+
+DAG:
+    prepare_opensubs ─┐
+                      ├─> mix -> count -> build_index -> prefilter -> llm_filter -> phrase_store
+    dump_c4 ──────────┘
+
+Для каждой стадии запоминается отпечаток (в .pipeline_state.json):
+- входов (файлы/каталоги из констант-путей скрипта),
+- параметров (все UPPER_CASE константы скрипта: F_MIN, GLOBAL_MIN_5, регэкспы, промпт...),
+- кода (сам скрипт + локальные модули, которые он импортирует; инструментация
+  из NOT_FINGERPRINTED на выходы не влияет и в отпечаток не входит),
+- выходов (чтобы заметить, что их кто-то поменял или удалил).
+Если ничего не изменилось — стадия пропускается. Независимые стадии идут параллельно,
+кроме cpu_bound: у каждой свой пул на все ядра, поэтому одновременно идёт только одна.
+
+Пути и параметры читаются из исходников через ast, скрипты не импортируются
+(у них тяжёлые зависимости). Стадии запускаются подпроцессами из текущего каталога.
+
+    python run_pipeline.py                 # всё, что устарело
+    python run_pipeline.py --dry-run       # показать, что будет запущено и почему
+    python run_pipeline.py --force count   # перезапустить count и всё ниже
+    python run_pipeline.py --content-hash  # отпечатки по полному содержимому файлов
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+STATE_FILE = Path(".pipeline_state.json")
+
+# Быстрый отпечаток файла: размер + mtime + хэш первых/последних SAMPLE_BYTES
+SAMPLE_BYTES = 1 << 20
+HASH_CHUNK = 8 << 20
+
+# Локальные модули, которые не меняют выходы стадий (метрики, --profile)
+NOT_FINGERPRINTED = {"metrics.py", "profiling.py"}
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str
+    deps: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)    # имена констант-путей в скрипте
+    outputs: list = field(default_factory=list)
+    reset: list = field(default_factory=list)     # удалить перед «грязным» перезапуском
+    fused_into: tuple = None  # (скрипт, константа): если она истинна, стадию делает другой скрипт
+    fused_outputs: tuple = None  # (константа, выходы): если она истинна, стадия пишет эти выходы
+    cpu_bound: bool = False   # пул процессов на все ядра — не запускать вместе с другой такой
+
+
+STAGES = [
+    Stage("prepare_opensubs", "prepare_opensubs_jsonl.py",
+          inputs=["INPUT_TXT"], outputs=["OUTPUT_JSONL"], cpu_bound=True),
+    Stage("dump_c4", "dump_c4_es.py",
+          inputs=["LOCAL_SHARDS_DIR"], outputs=["OUTPUT_JSONL"], cpu_bound=True),
+    Stage("mix", "make_mixed_corpus.py", deps=["prepare_opensubs", "dump_c4"],
+          inputs=["SOURCES"], outputs=["OUT_JSONL"]),
+    Stage("count", "count_ngrams_external.py", deps=["mix"],
+          inputs=["INPUT_JSONL"],
+          outputs=["OUTPUT_UNI", "OUTPUT_NGRAMS_2_4", "OUTPUT_NGRAMS_5"]),
+    Stage("build_index", "build_phrase_index.py", deps=["count"],
+          inputs=["UNIGRAMS", "NGRAMS_2_4", "NGRAMS_5"], outputs=["PHRASE_INDEX"],
+          fused_outputs=("FUSED_PREFILTER", ["prefilter_phrases.PHRASE_INDEX_OUT"])),
+    Stage("prefilter", "prefilter_phrases.py", deps=["build_index"],
+          inputs=["PHRASE_INDEX_IN"], outputs=["PHRASE_INDEX_OUT"],
+          fused_into=("build_phrase_index.py", "FUSED_PREFILTER")),
+    Stage("llm_filter", "filter_phrases_llm.py", deps=["prefilter"],
+          inputs=["PHRASE_INDEX"], outputs=["OUTPUT_INDEX"], reset=["CHECKPOINT"]),
+    Stage("phrase_store", "phrase_store.py", deps=["llm_filter"],
+          inputs=["PHRASE_INDEX"], outputs=["STORE_DIR"]),
+]
+
+
+# ==========================
+#   РАЗБОР СКРИПТОВ
+# ==========================
+
+def script_constants(script: Path):
+    """
+    Верхнеуровневые UPPER_CASE присваивания скрипта:
+    (исходный текст каждой константы, вычисленные значения тех, что удалось вычислить).
+    """
+    src = script.read_text(encoding="utf-8")
+    tree = ast.parse(src)
+    sources = {}
+    values = {}
+    env = {"Path": Path, "os": os}
+
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id.isupper():
+                sources[target.id] = ast.get_source_segment(src, node.value)
+                try:
+                    expr = ast.Expression(node.value)
+                    values[target.id] = eval(compile(expr, str(script), "eval"), env, dict(values))
+                except Exception:
+                    pass
+
+    return sources, values
+
+
+def _paths_in(value):
+    """Все Path внутри значения константы (Path, список, кортеж...)."""
+    if isinstance(value, Path):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _paths_in(v)
+
+
+def stage_paths(stage: Stage, kind: str):
+    """
+    Пути из констант стадии; "module.NAME" — константа другого скрипта.
+    В слитом режиме (fused_outputs) выходы берутся из его списка.
+    """
+    _, values = script_constants(SCRIPTS_DIR / stage.script)
+    names = getattr(stage, kind)
+    if kind == "outputs" and stage.fused_outputs and values.get(stage.fused_outputs[0]):
+        names = stage.fused_outputs[1]
+    paths = []
+    for name in names:
+        if "." in name:
+            mod, const = name.rsplit(".", 1)
+            paths.extend(_paths_in(script_constants(SCRIPTS_DIR / f"{mod}.py")[1].get(const)))
+        else:
+            paths.extend(_paths_in(values.get(name)))
+    return paths
+
+
+def local_imports(script: Path, seen=None):
+    """
+    Скрипт и все локальные модули (*.py рядом), которые он транзитивно импортирует,
+    кроме NOT_FINGERPRINTED (и того, что тянется только через них).
+    """
+    seen = set() if seen is None else seen
+    if script in seen:
+        return seen
+    seen.add(script)
+    tree = ast.parse(script.read_text(encoding="utf-8"))
+    for node in ast.walk(tree):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        for name in names:
+            mod = SCRIPTS_DIR / (name.split(".")[0] + ".py")
+            if mod.exists() and mod.name not in NOT_FINGERPRINTED:
+                local_imports(mod, seen)
+    return seen
+
+
+# ==========================
+#   ОТПЕЧАТКИ
+# ==========================
+
+def _hash_file(path: Path, full: bool) -> str:
+    h = blake2b(digest_size=16)
+    st = path.stat()
+    h.update(str(st.st_size).encode())
+    with path.open("rb") as f:
+        if full:
+            while True:
+                chunk = f.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+        else:
+            h.update(str(st.st_mtime_ns).encode())
+            h.update(f.read(SAMPLE_BYTES))
+            if st.st_size > 2 * SAMPLE_BYTES:
+                f.seek(-SAMPLE_BYTES, os.SEEK_END)
+            h.update(f.read(SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def fingerprint_path(path: Path, full: bool):
+    """
+    Отпечаток файла или каталога (по всем файлам внутри); для шардированного
+    артефакта (манифест shards.py) — по манифесту и шардам. None — пути нет.
+    """
+    if path.is_file():
+        return _hash_file(path, full)
+    import shards  # тянет numpy — только когда путь не обычный файл
+    manifest = shards.manifest_path(path)
+    if manifest.is_file():
+        h = blake2b(digest_size=16)
+        h.update(_hash_file(manifest, full).encode())
+        for part in shards.parts(path):
+            h.update(str(fingerprint_path(part, full)).encode())
+        return h.hexdigest()
+    if path.is_dir():
+        h = blake2b(digest_size=16)
+        for p in sorted(path.rglob("*")):
+            if p.is_file():
+                h.update(str(p.relative_to(path)).encode())
+                h.update(_hash_file(p, full).encode())
+        return h.hexdigest()
+    return None
+
+
+def code_fingerprint(stage: Stage) -> str:
+    h = blake2b(digest_size=16)
+    for mod in sorted(local_imports(SCRIPTS_DIR / stage.script)):
+        h.update(mod.name.encode())
+        h.update(mod.read_bytes())
+    return h.hexdigest()
+
+
+def stage_record(stage: Stage, full: bool) -> dict:
+    """Текущие отпечатки входов, параметров и кода стадии."""
+    params, _ = script_constants(SCRIPTS_DIR / stage.script)
+    return {
+        "inputs": {str(p): fingerprint_path(p, full) for p in stage_paths(stage, "inputs")},
+        "params": params,
+        "code": code_fingerprint(stage),
+    }
+
+
+def why_stale(stage: Stage, record: dict, prev: dict, full: bool):
+    """Список причин перезапуска; пустой — стадия актуальна."""
+    if not prev:
+        return ["never completed"]
+    reasons = []
+    for key in sorted(set(record["inputs"]) | set(prev.get("inputs", {}))):
+        if record["inputs"].get(key) != prev.get("inputs", {}).get(key):
+            reasons.append(f"input changed: {key}")
+    for key in sorted(set(record["params"]) | set(prev.get("params", {}))):
+        if record["params"].get(key) != prev.get("params", {}).get(key):
+            reasons.append(f"param changed: {key}")
+    if record["code"] != prev.get("code"):
+        reasons.append("code changed")
+    for path, fp in prev.get("outputs", {}).items():
+        if fingerprint_path(Path(path), full) != fp:
+            reasons.append(f"output missing or modified: {path}")
+    return reasons
+
+
+# ==========================
+#   СОСТОЯНИЕ
+# ==========================
+
+def load_state() -> dict:
+    if STATE_FILE.exists():
+        try:
+            return json.loads(STATE_FILE.read_text(encoding="utf-8"))
+        except ValueError:
+            return {}
+    return {}
+
+
+def save_state(state: dict) -> None:
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(STATE_FILE)
+
+
+# ==========================
+#   ЗАПУСК
+# ==========================
+
+def run_stage(stage: Stage) -> float:
+    print(f"[pipeline] >>> {stage.name}: {stage.script}", flush=True)
+    t0 = time.time()
+    subprocess.run([sys.executable, str(SCRIPTS_DIR / stage.script)], check=True)
+    return time.time() - t0
+
+
+def downstream(names, stages):
+    """names + все стадии, зависящие от них (транзитивно)."""
+    result = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for s in stages:
+            if s.name not in result and result.intersection(s.deps):
+                result.add(s.name)
+                changed = True
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", nargs="+", metavar="STAGE", help="рассматривать только эти стадии")
+    ap.add_argument("--force", nargs="+", metavar="STAGE", default=[],
+                    help="перезапустить эти стадии и всё, что от них зависит")
+    ap.add_argument("--dry-run", action="store_true", help="только показать план")
+    ap.add_argument("--content-hash", action="store_true",
+                    help="отпечатки по полному содержимому файлов (медленно на больших файлах)")
+    ap.add_argument("-j", "--jobs", type=int, default=2, help="сколько стадий запускать одновременно")
+    args = ap.parse_args()
+
+    by_name = {s.name: s for s in STAGES}
+    for name in (args.only or []) + args.force:
+        if name not in by_name:
+            ap.error(f"unknown stage: {name} (known: {', '.join(by_name)})")
+
+    selected = set(args.only) if args.only else set(by_name)
+    forced = downstream(args.force, STAGES)
+    full = args.content_hash
+    state = load_state()
+
+    pending = [s for s in STAGES if s.name in selected]
+    finished = {s.name for s in STAGES if s.name not in selected}
+    failed = set()
+    planned = set()
+    running = {}
+
+    def start(stage, pool):
+        if stage.fused_into:
+            script, const = stage.fused_into
+            if script_constants(SCRIPTS_DIR / script)[1].get(const):
+                print(f"[pipeline] skip {stage.name}: fused into {script} ({const})")
+                return None
+        record = stage_record(stage, full)
+        prev = state.get(stage.name)
+        reasons = ["forced"] if stage.name in forced else why_stale(stage, record, prev, full)
+        if args.dry_run and planned.intersection(stage.deps):
+            reasons.append("upstream will run")
+        if not reasons:
+            print(f"[pipeline] skip {stage.name}: up to date")
+            return None
+        print(f"[pipeline] run {stage.name}: " + "; ".join(reasons))
+        if args.dry_run:
+            planned.add(stage.name)
+            return None
+        if prev:
+            # прошлый завершённый прогон устарел — его чекпоинты не годятся
+            _, values = script_constants(SCRIPTS_DIR / stage.script)
+            for name in stage.reset:
+                for p in _paths_in(values.get(name)):
+                    p.unlink(missing_ok=True)
+        state.pop(stage.name, None)
+        save_state(state)
+        return pool.submit(lambda: (record, run_stage(stage)))
+
+    with ThreadPoolExecutor(max(1, args.jobs)) as pool:
+        while pending or running:
+            # запускаем всё, что можно; пропущенные стадии сразу открывают следующие
+            progress = True
+            while progress:
+                progress = False
+                for stage in list(pending):
+                    if any(d in failed for d in stage.deps):
+                        pending.remove(stage)
+                        failed.add(stage.name)
+                        print(f"[pipeline] skip {stage.name}: upstream failed")
+                    elif all(d in finished for d in stage.deps):
+                        if stage.cpu_bound and any(s.cpu_bound for s in running.values()):
+                            continue
+                        pending.remove(stage)
+                        fut = start(stage, pool)
+                        if fut is None:
+                            finished.add(stage.name)
+                            progress = True
+                        else:
+                            running[fut] = stage
+
+            if not running:
+                # ничего не идёт и ничего не запустить — ждать нечего
+                for stage in pending:
+                    print(f"[pipeline] FAILED {stage.name}: dependencies can never finish")
+                    failed.add(stage.name)
+                break
+
+            # блокируемся до завершения хотя бы одной стадии
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage = running.pop(fut)
+                try:
+                    record, seconds = fut.result()
+                except subprocess.CalledProcessError as e:
+                    print(f"[pipeline] FAILED {stage.name}: exit code {e.returncode}")
+                    failed.add(stage.name)
+                    continue
+                record["outputs"] = {
+                    str(p): fingerprint_path(p, full) for p in stage_paths(stage, "outputs")
+                }
+                record["seconds"] = round(seconds, 1)
+                record["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+                state[stage.name] = record
+                save_state(state)
+                finished.add(stage.name)
+                print(f"[pipeline] <<< {stage.name}: {seconds:.1f}s")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
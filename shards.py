@@ -0,0 +1,125 @@
+"""
+Хэш-шардинг jsonl-артефактов.
+
+Вместо одного freq_ngrams_2_4.jsonl стадия может писать P файлов
+freq_ngrams_2_4.000-of-008.jsonl ... и манифест freq_ngrams_2_4.jsonl.manifest.json.
+Запись попадает в шард crc32(key) % P, поэтому шард отсортированного потока
+тоже отсортирован. Следующая стадия берёт parts(path): список шардов из манифеста
+или [path], если манифеста нет, — и может обрабатывать их параллельно.
+
+    with ShardedWriter(OUTPUT, SHARDS) as out:   # SHARDS = 1 — обычный один файл
+        out.write(key, line)
+"""
+import json
+import os
+import zlib
+from pathlib import Path
+
+import line_index
+from corpus_io import open_text
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def _split_ext(path: Path):
+    name = path.name
+    for ext in (".jsonl.zst", ".jsonl.gz", ".jsonl"):
+        if name.endswith(ext):
+            return name[:-len(ext)], ext
+    return name, ""
+
+
+def shard_path(path, i: int, n: int) -> Path:
+    path = Path(path)
+    base, ext = _split_ext(path)
+    return path.with_name(f"{base}.{i:03d}-of-{n:03d}{ext}")
+
+
+def manifest_path(path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + MANIFEST_SUFFIX)
+
+
+def shard_of(key: str, n: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % n
+
+
+def read_manifest(path):
+    """Манифест шардированного артефакта или None."""
+    manifest = manifest_path(path)
+    if not manifest.exists():
+        return None
+    return json.loads(manifest.read_text(encoding="utf-8"))
+
+
+def parts(path) -> list:
+    """Файлы артефакта: шарды из манифеста, иначе сам path."""
+    path = Path(path)
+    meta = read_manifest(path)
+    if meta is None:
+        return [path]
+    return [path.with_name(name) for name in meta["shards"]]
+
+
+def clear(path):
+    """Удалить артефакт в любой раскладке (один файл или шарды + манифест)."""
+    path = Path(path)
+    meta = read_manifest(path)
+    if meta is not None:
+        for name in meta["shards"]:
+            for p in (path.with_name(name), line_index.sidecar_path(path.with_name(name))):
+                if p.exists():
+                    os.remove(p)
+        os.remove(manifest_path(path))
+    for p in (path, line_index.sidecar_path(path)):
+        if p.exists():
+            os.remove(p)
+
+
+def write_manifest(path, files, records):
+    path = Path(path)
+    meta = {
+        "shards": [Path(f).name for f in files],
+        "records": list(records),
+        "partition": "crc32(key) % shards",
+    }
+    tmp = manifest_path(path).with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(manifest_path(path))
+
+
+class ShardedWriter:
+    """
+    Запись артефакта в n шардов по crc32(key) % n (n = 1 — один файл path без манифеста).
+    При закрытии пишутся сайдкары строк и манифест; старый артефакт удаляется при открытии.
+    """
+
+    def __init__(self, path, n: int = 1):
+        self.path = Path(path)
+        self.n = n
+        clear(self.path)
+        self.files = [self.path] if n == 1 else [shard_path(self.path, i, n) for i in range(n)]
+        self.outs = [open_text(f, "w", index=True) for f in self.files]
+        self.records = [0] * len(self.files)
+
+    def write(self, key: str, line: str):
+        i = shard_of(key, self.n) if self.n > 1 else 0
+        self.outs[i].write(line)
+        self.records[i] += 1
+
+    def close(self, complete: bool = True):
+        for out in self.outs:
+            out.close()
+        if not complete:
+            return
+        for f in self.files:
+            line_index.write_sidecar(f)
+        if self.n > 1:
+            write_manifest(self.path, self.files, self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # при ошибке манифест не пишем — недописанный артефакт не подхватят
+        self.close(complete=exc_type is None)
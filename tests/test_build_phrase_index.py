@@ -0,0 +1,52 @@
+import json
+
+import build_phrase_index as bpi
+import prefilter_phrases as pf
+
+
+PHRASES = {
+    "qué tal": 40, "dónde está el niño": 12, "hola señor": 9, "de la": 50,
+    "que se": 7, "visita www.ejemplo.com hoy": 6, "el 19 de mayo 2017": 5,
+    "NO LO SÉ": 8, "the cat is": 6, "¡vamos ya!": 30, "hasta mañana": 4,
+}
+PHRASES_5 = {"no sé lo que pasa": 9, "y yo te lo dije": 6, "a b c d e": 5}
+
+
+def _write_counts(path, counts):
+    with open(path, "w", encoding="utf-8") as f:
+        for text in sorted(counts):
+            f.write(json.dumps({"text": text, "count": counts[text]}, ensure_ascii=False) + "\n")
+
+
+def test_fused_prefilter_matches_build_then_prefilter(tmp_path, monkeypatch):
+    uni = {w: 10 + i for i, w in enumerate(
+        sorted({w for p in list(PHRASES) + list(PHRASES_5) for w in p.split()}))}
+    _write_counts(tmp_path / "uni.jsonl", uni)
+    _write_counts(tmp_path / "ng24.jsonl", PHRASES)
+    _write_counts(tmp_path / "ng5.jsonl", PHRASES_5)
+    monkeypatch.setattr(bpi, "UNIGRAMS", tmp_path / "uni.jsonl")
+    monkeypatch.setattr(bpi, "NGRAMS_2_4", tmp_path / "ng24.jsonl")
+    monkeypatch.setattr(bpi, "NGRAMS_5", tmp_path / "ng5.jsonl")
+    monkeypatch.setattr(bpi, "PHRASE_INDEX", tmp_path / "index.jsonl")
+    monkeypatch.setattr(bpi, "F_MIN", 5)
+
+    monkeypatch.setattr(bpi, "FUSED_PREFILTER", False)
+    bpi.main()
+    monkeypatch.setattr(pf, "PHRASE_INDEX_IN", tmp_path / "index.jsonl")
+    monkeypatch.setattr(pf, "PHRASE_INDEX_OUT", tmp_path / "separate.jsonl")
+    pf.main()
+
+    monkeypatch.setattr(bpi, "FUSED_PREFILTER", True)
+    monkeypatch.setattr(pf, "PHRASE_INDEX_OUT", tmp_path / "fused.jsonl")
+    bpi.main()
+
+    separate = (tmp_path / "separate.jsonl").read_text(encoding="utf-8")
+    fused = (tmp_path / "fused.jsonl").read_text(encoding="utf-8")
+    kept = [json.loads(line)["phrase"] for line in separate.splitlines()]
+    assert 0 < len(kept) < len(PHRASES) + len(PHRASES_5)
+    assert fused == separate
+
+    freq_word = bpi.load_unigrams()
+    records = [rec for path in (bpi.NGRAMS_2_4, bpi.NGRAMS_5)
+               for rec in bpi.iter_index_records(path, freq_word, pf.simple_prefilter)]
+    assert [json.loads(line) for line in separate.splitlines()] == records
@@ -0,0 +1,38 @@
+import importlib.util
+import sys
+
+import pytest
+
+import codec
+
+
+def _load_codec(monkeypatch, hide):
+    """Отдельная копия codec.py с выключенными бэкендами hide."""
+    for name in hide:
+        monkeypatch.setitem(sys.modules, name, None)
+    spec = importlib.util.spec_from_file_location(f"codec_without_{'_'.join(hide)}", codec.__file__)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@pytest.fixture(params=[(), ("orjson",), ("orjson", "msgspec")], ids=["default", "msgspec", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == ("orjson",) and importlib.util.find_spec("msgspec") is None:
+        pytest.skip("msgspec is not installed")
+    return _load_codec(monkeypatch, request.param)
+
+
+@pytest.mark.parametrize("line, expected", [
+    (b'{"text": "hola"}', "hola"),
+    (b'{"text": null}', ""),
+    (b'{"id": "x"}', ""),
+    ('{"text": "¿qué?", "extra": 1}'.encode(), "¿qué?"),
+])
+def test_decode_text_same_on_all_backends(backend, line, expected):
+    assert backend.decode_text(line) == expected
+
+
+def test_dumps_is_compact_utf8(backend):
+    assert backend.dumps_line({"text": "señor", "count": 2}) == '{"text":"señor","count":2}\n'
+    assert backend.decode_count(backend.encode_count("señor", 2)) == ("señor", 2)
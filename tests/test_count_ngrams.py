@@ -0,0 +1,114 @@
+import json
+import random
+from collections import Counter
+
+import pytest
+
+import count_ngrams_external as cne
+from count_ngrams_external import HeavyHitters
+
+
+def _zipf_batches(rng, n_batches=30, batch=500, vocab=2000):
+    weights = [1 / (r + 1) for r in range(vocab)]
+    keys = [f"w{r}" for r in range(vocab)]
+    for _ in range(n_batches):
+        yield Counter(rng.choices(keys, weights, k=batch))
+
+
+def test_heavy_hitters_exact_while_small():
+    hh = HeavyHitters(k=50)
+    total = Counter()
+    for b in _zipf_batches(random.Random(0), n_batches=5, batch=40, vocab=60):
+        hh.merge(b)
+        total.update(b)
+    assert hh.error == 0
+    assert hh.counts == total
+
+
+def test_heavy_hitters_error_bounds():
+    k = 100
+    hh = HeavyHitters(k)
+    total = Counter()
+    for b in _zipf_batches(random.Random(1)):
+        hh.merge(b)
+        total.update(b)
+        assert len(hh.counts) <= 2 * k
+    n = sum(total.values())
+    assert 0 < hh.error <= n / (k + 1)
+    for key, f in total.items():
+        c = hh.counts.get(key, 0)
+        assert c <= f <= c + hh.error
+    # всё, что чаще error, обязано остаться в сводке
+    assert {key for key, f in total.items() if f > hh.error} <= set(hh.counts)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    rng = random.Random(5)
+    words = ["hola", "qué", "tal", "señor", "niño", "dónde", "está", "vamos"]
+    src = tmp_path / "mix.jsonl"
+    with open(src, "w", encoding="utf-8") as f:
+        for i in range(400):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(2, 8)))
+            f.write(json.dumps({"id": i, "text": text}, ensure_ascii=False) + "\n")
+    monkeypatch.setattr(cne, "INPUT_JSONL", src)
+    monkeypatch.setattr(cne, "BATCH_SIZE", 50)
+    monkeypatch.setattr(cne, "SHARDS", 1)
+
+    def outputs(name):
+        d = tmp_path / name
+        d.mkdir()
+        for const in ("OUTPUT_UNI", "OUTPUT_NGRAMS_2_4", "OUTPUT_NGRAMS_5"):
+            monkeypatch.setattr(cne, const, d / getattr(cne, const).name)
+        return d
+
+    return outputs
+
+
+def test_topk_matches_exact_when_k_covers_vocabulary(corpus, monkeypatch):
+    exact_dir = corpus("exact")
+    cne.process()
+    topk_dir = corpus("topk")
+    monkeypatch.setattr(cne, "TOPK_UNI", 10_000)
+    monkeypatch.setattr(cne, "TOPK_2_4", 100_000)
+    cne.process_topk()
+
+    for name in ("freq_unigrams.jsonl", "freq_ngrams_2_4.jsonl"):
+        exact = _read(exact_dir / name)
+        topk = _read(topk_dir / name)
+        assert all(r["error"] == 0 for r in topk)
+        assert [(r["text"], r["count"]) for r in topk] == [(r["text"], r["count"]) for r in exact]
+
+
+def test_topk_memory_bounded_by_k(corpus, monkeypatch):
+    exact_dir = corpus("exact2")
+    cne.process()
+    topk_dir = corpus("topk2")
+    k = 20
+    monkeypatch.setattr(cne, "TOPK_UNI", k)
+    monkeypatch.setattr(cne, "TOPK_2_4", k)
+    monkeypatch.setattr(cne, "TOPK_5", k)
+    # строка корпуса — не больше 8 токенов: до 7 + 6 + 5 новых 2–4-грамм
+    peak = []
+    trim = HeavyHitters.trim
+
+    def spy(self):
+        peak.append(len(self.counts))
+        trim(self)
+
+    monkeypatch.setattr(HeavyHitters, "trim", spy)
+    monkeypatch.setattr(cne, "count_batches", lambda: pytest.fail("topk must not build batch counters"))
+    cne.process_topk()
+    assert max(peak) <= 2 * k + 18
+
+    for name in ("freq_unigrams.jsonl", "freq_ngrams_2_4.jsonl"):
+        exact = {r["text"]: r["count"] for r in _read(exact_dir / name)}
+        topk = _read(topk_dir / name)
+        assert 0 < len(topk) <= k
+        for r in topk:
+            assert r["count"] <= exact[r["text"]] <= r["count"] + r["error"]
@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import pytest
+
+from dedup import (BANDS, CAPACITY_LOG2, MAX_LOAD, MIN_CAPACITY_LOG2, Deduper, FingerprintSet,
+                   MinHasher, dedup_keys, table_log2)
+
+
+def test_fingerprint_set_matches_python_set():
+    rng = np.random.default_rng(0)
+    fs = FingerprintSet(capacity_log2=12)  # маленькая таблица — много коллизий и пробирования
+    seen = set()
+    for _ in range(20):
+        # ключи из узкого диапазона: повторы между пачками и внутри пачки
+        batch = rng.integers(1, 3000, 150, dtype=np.uint64)
+        batch[::7] = batch[0]
+        expected = []
+        for k in batch.tolist():
+            expected.append(k not in seen)
+            seen.add(k)
+        assert fs.add_batch(batch).tolist() == expected
+    assert len(fs) == len(seen)
+
+
+def test_fingerprint_set_saturation_keeps_lookups():
+    fs = FingerprintSet(capacity_log2=6, max_load=0.5)  # limit = 32
+    first = np.arange(1, 31, dtype=np.uint64)
+    assert fs.add_batch(first).all()
+    mask = fs.add_batch(np.arange(20, 60, dtype=np.uint64))
+    assert fs.saturated
+    assert not mask[:11].any()   # 20..30 уже были
+    assert mask[11:].all()       # неизвестные считаются новыми
+    assert len(fs) == 32         # таблица заполнена ровно до limit, дальше не запоминается
+    assert fs.add_batch(np.array([40, 50], dtype=np.uint64)).all()
+    assert fs.add_batch(np.arange(1, 31, dtype=np.uint64)).sum() == 0
+    assert len(fs) == 32
+
+
+def test_known_keys_do_not_saturate():
+    fs = FingerprintSet(capacity_log2=6, max_load=0.5)  # limit = 32
+    keys = np.arange(1, 31, dtype=np.uint64)
+    fs.add_batch(keys)
+    # 30 известных + 2 новых = ровно limit
+    mask = fs.add_batch(np.concatenate([keys, np.array([100, 101], dtype=np.uint64)]))
+    assert mask.tolist() == [False] * 30 + [True, True]
+    assert len(fs) == 32
+    assert not fs.add_batch(np.array([100, 101], dtype=np.uint64)).any()
+
+
+def test_table_sized_from_line_count():
+    assert table_log2(0) == MIN_CAPACITY_LOG2
+    assert table_log2(10**12) == CAPACITY_LOG2
+    n = 1_000_000
+    log2 = table_log2(n)
+    assert n <= (1 << log2) * MAX_LOAD < 2 * n
+    assert len(Deduper("exact", lines=n).seen_keys.table) == 1 << log2
+    assert len(Deduper("near", lines=1000).seen_keys.table) == 1 << table_log2(1000 * BANDS)
+
+
+def test_exact_dedup_ignores_case_and_spaces():
+    d = Deduper("exact", capacity_log2=10)
+    keep = d.filter(["Hola  amigo", "hola amigo", "adiós", " HOLA AMIGO "])
+    assert keep.tolist() == [True, False, True, False]
+    assert d.check_keys(dedup_keys("exact", ["adiós", "nuevo"])).tolist() == [False, True]
+    assert (d.seen, d.removed) == (6, 3)
+
+
+def _doc(rng, n=200):
+    words = ["casa", "perro", "gato", "sol", "luna", "mar", "río", "árbol", "flor", "cielo",
+             "tierra", "fuego", "agua", "viento", "nube", "piedra", "camino", "puerta"]
+    return [rng.choice(words) for _ in range(n)]
+
+
+def test_near_dedup_catches_small_edits():
+    rng = random.Random(3)
+    base = _doc(rng)
+    edited = list(base)
+    edited[100] = "ventana"
+    other = _doc(rng)
+    d = Deduper("near", capacity_log2=12)
+    keep = d.filter([" ".join(base), " ".join(other)])
+    assert keep.tolist() == [True, True]
+    assert d.filter([" ".join(edited)]).tolist() == [False]
+
+
+def test_minhash_is_deterministic_and_shaped():
+    a, b = MinHasher(), MinHasher()
+    text = "uno dos tres cuatro cinco seis siete"
+    assert np.array_equal(a.band_keys(text), b.band_keys(text))
+    assert dedup_keys("near", [text, "otra cosa"]).shape == (2, a.bands)
+    with pytest.raises(ValueError):
+        MinHasher(num_perm=10, bands=3)
@@ -0,0 +1,101 @@
+import gzip
+import json
+
+import pytest
+
+import dump_c4_es as c4
+
+DOCS_PER_SHARD = 30
+
+
+def _doc(shard, i):
+    return f"Documento {i} del shard {shard}: <b>hola</b> https://ejemplo.es  qué tal"
+
+
+@pytest.fixture
+def shards_dir(tmp_path, monkeypatch):
+    src = tmp_path / "shards"
+    src.mkdir()
+    for s in range(4):
+        with gzip.open(src / f"c4-es.{s:05d}.json.gz", "wt", encoding="utf-8") as f:
+            for i in range(DOCS_PER_SHARD):
+                f.write(json.dumps({"text": _doc(s, i), "url": "x"}) + "\n")
+                f.write(json.dumps({"text": "corto"}) + "\n")  # отсекается по длине
+    monkeypatch.setattr(c4, "LOCAL_SHARDS_DIR", src)
+    monkeypatch.setattr(c4, "PARTS_DIR", tmp_path / "parts")
+    monkeypatch.setattr(c4, "OUTPUT_JSONL", tmp_path / "c4.jsonl")
+    monkeypatch.setattr(c4, "WORKERS", 2)
+    return src
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_process_shard(shards_dir, tmp_path):
+    shard = sorted(shards_dir.iterdir())[1]
+    part = tmp_path / "part.jsonl"
+    assert c4.process_shard(shard, part, 10**9) == DOCS_PER_SHARD
+    recs = [json.loads(line) for line in _lines(part)]
+    assert recs == [c4.make_record(_doc(1, i)) for i in range(DOCS_PER_SHARD)]
+    assert recs[0]["text"] == "Documento 0 del shard 1: hola qué tal"
+
+    assert c4.process_shard(shard, part, 7) == 7
+    assert len(_lines(part)) == 7
+    assert not part.with_suffix(".tmp").exists()
+
+
+def test_budget_caps_conversion_and_output(shards_dir, monkeypatch):
+    monkeypatch.setattr(c4, "MAX_DOCS", 50)
+    assert c4.dump_local_shards() == 50
+    assert len(_lines(c4.OUTPUT_JSONL)) == 50
+    # в полёте не больше бюджета: лишние документы не конвертируются
+    parts = sorted(c4.PARTS_DIR.glob("*.jsonl"))
+    assert sum(len(_lines(p)) for p in parts) == 50
+    # упёршиеся в долю шарды не считаются готовыми
+    assert c4._load_manifest(c4.PARTS_DIR / "manifest.json") == {}
+
+
+def test_small_shards_complete_within_budget(shards_dir, monkeypatch):
+    monkeypatch.setattr(c4, "MAX_DOCS", 10**6)
+    assert c4.dump_local_shards() == 4 * DOCS_PER_SHARD
+    expected = [json.dumps(c4.make_record(_doc(s, i)), ensure_ascii=False)
+                for s in range(4) for i in range(DOCS_PER_SHARD)]
+    assert [json.dumps(json.loads(line), ensure_ascii=False) for line in _lines(c4.OUTPUT_JSONL)] == expected
+    done = c4._load_manifest(c4.PARTS_DIR / "manifest.json")
+    assert sorted(done) == sorted(p.name for p in shards_dir.iterdir())
+
+
+def test_resume_skips_done_and_rewrites_partial(shards_dir, monkeypatch):
+    monkeypatch.setattr(c4, "MAX_DOCS", 10**6)
+    c4.dump_local_shards()
+    full = _lines(c4.OUTPUT_JSONL)
+    names = sorted(p.name for p in shards_dir.iterdir())
+    manifest = c4.PARTS_DIR / "manifest.json"
+
+    # прерванный шард: нет в манифесте, part обрезан, висит .tmp
+    done = c4._load_manifest(manifest)
+    del done[names[3]]
+    c4._save_manifest(manifest, done)
+    part3 = c4._part_path(shards_dir / names[3])
+    part3.write_text(_lines(part3)[0] + "\n", encoding="utf-8")
+    part3.with_suffix(".tmp").write_text("garbage\n", encoding="utf-8")
+    # готовые шарды не перечитываются: их исходники больше не читаются
+    for name in names[:3]:
+        (shards_dir / name).write_bytes(b"not gzip")
+
+    assert c4.dump_local_shards() == len(full)
+    assert _lines(c4.OUTPUT_JSONL) == full
+    assert len(_lines(part3)) == DOCS_PER_SHARD
+    assert sorted(c4._load_manifest(manifest)) == names
+
+
+def test_global_cap_in_concat(shards_dir, monkeypatch):
+    monkeypatch.setattr(c4, "MAX_DOCS", 10**6)
+    c4.dump_local_shards()
+    full = _lines(c4.OUTPUT_JSONL)
+    # все шарды уже готовы, лимит применяется только при склейке
+    monkeypatch.setattr(c4, "MAX_DOCS", 45)
+    assert c4.dump_local_shards() == 45
+    assert _lines(c4.OUTPUT_JSONL) == full[:45]
@@ -0,0 +1,28 @@
+import pytest
+
+from es_tokenizer import make_tokenizer, tokenize
+
+
+@pytest.mark.parametrize("text", ["hola", "Hola", "¡Hola", "hola,", "¡HOLA!"])
+def test_default_merges_case_and_punct_variants(text):
+    assert tokenize(text) == ["hola"]
+
+
+def test_case_variant_ngrams_collapse():
+    assert tokenize("Me que") == tokenize("me que") == ["me", "que"]
+
+
+def test_split_mode_keeps_punct_clusters():
+    tok = make_tokenizer(punct="split", casefold=False)
+    assert tok("¿Qué pasa?!") == ["¿", "Qué", "pasa", "?!"]
+
+
+def test_word_internal_marks_numbers_and_elisions():
+    assert tokenize("Vamos pa' franco-alemán, 3,5 pa’lante") == [
+        "vamos", "pa'", "franco-alemán", "3,5", "pa'lante",
+    ]
+
+
+def test_unknown_punct_mode():
+    with pytest.raises(ValueError):
+        make_tokenizer(punct="keep")
@@ -0,0 +1,12 @@
+import pytest
+
+import filter_phrases_llm as llm
+
+
+@pytest.mark.parametrize("name", ["out.jsonl.zst", "out.jsonl.gz"])
+def test_compressed_resumable_output_is_refused(tmp_path, monkeypatch, name):
+    monkeypatch.setattr(llm, "OUTPUT_INDEX", tmp_path / name)
+    monkeypatch.setattr(llm, "CHECKPOINT", tmp_path / "checkpoint.json")
+    with pytest.raises(ValueError, match="uncompressed"):
+        llm.main()
+    assert not (tmp_path / name).exists()
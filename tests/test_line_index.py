@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import line_index
+from corpus_io import open_text
+
+
+@pytest.mark.parametrize("name", ["a.jsonl", "a.jsonl.gz"])
+@pytest.mark.parametrize("tail", ["\n", ""])
+def test_sidecar_from_writer_matches_scan(tmp_path, monkeypatch, name, tail):
+    path = tmp_path / name
+    lines = ['{"text": "hola"}', '{"text": "¿qué tal, señor?"}', "", '{"text": "adiós"}']
+    with open_text(path, "w", index=True) as out:
+        out.write("\n".join(lines) + tail)
+
+    expected = line_index.scan_offsets(path)
+
+    def no_rescan(_):
+        raise AssertionError("written file must not be re-read")
+
+    monkeypatch.setattr(line_index, "scan_offsets", no_rescan)
+    idx = line_index.write_sidecar(path)
+    assert idx.offsets.tolist() == expected.tolist()
+    assert len(idx) == 4
+
+
+def test_sidecar_falls_back_to_scan_for_appended_file(tmp_path):
+    path = tmp_path / "b.jsonl"
+    with open_text(path, "w", index=True) as out:
+        out.write("1\n2\n")
+    line_index.write_sidecar(path)
+    with open_text(path, "a") as out:
+        out.write("3\n")
+    idx = line_index.write_sidecar(path)
+    assert idx.offsets.tolist() == [0, 2, 4, 6]
+    assert line_index.load(path).offsets.tolist() == [0, 2, 4, 6]
+
+
+def _make(tmp_path, name, n=200):
+    path = tmp_path / name
+    with open_text(path, "w", index=True) as out:
+        for i in range(n):
+            out.write('{"text": "%s"}\n' % ("ñ" * (i % 7) + str(i)))
+    line_index.write_sidecar(path)
+    with open_text(path) as f:
+        return path, f.readlines()
+
+
+@pytest.mark.parametrize("name", ["c.jsonl", "c.jsonl.gz", "c.jsonl.zst"])
+def test_iter_lines_matches_readlines(tmp_path, name):
+    path, lines = _make(tmp_path, name)
+    idx = line_index.load(path, build=False)
+    assert len(idx) == len(lines)
+    numbers = [0, 1, 2, 50, 51, 120, len(lines) - 1]
+    assert list(idx.iter_lines(numbers)) == [(n, lines[n]) for n in numbers]
+    assert list(idx.iter_lines([])) == []
+
+
+@pytest.mark.parametrize("name", ["c.jsonl", "c.jsonl.gz", "c.jsonl.zst"])
+def test_sample_matches_readlines(tmp_path, name):
+    path, lines = _make(tmp_path, name)
+    idx = line_index.load(path)
+    picked = idx.sample(30, seed=7)
+    assert len(set(picked.tolist())) == 30 and list(picked) == sorted(picked)
+    assert picked.tolist() == idx.sample(30, seed=7).tolist()
+    assert [line for _, line in idx.iter_lines(picked)] == [lines[n] for n in picked]
+    assert idx.sample(10**6).tolist() == list(range(len(lines)))
+
+
+def test_open_at_matches_readlines(tmp_path):
+    path, lines = _make(tmp_path, "c.jsonl")
+    idx = line_index.load(path)
+    for n in (0, 1, 99, len(lines) - 1, len(lines)):
+        with idx.open_at(n) as f:
+            assert f.readlines() == lines[n:]
+
+
+def test_open_at_refuses_compressed(tmp_path):
+    path, _ = _make(tmp_path, "c.jsonl.gz")
+    with pytest.raises(ValueError):
+        line_index.load(path).open_at(1)
+
+
+@pytest.mark.parametrize("k", [1, 3, 8, 1000])
+def test_splits_and_byte_ranges_cover_file(tmp_path, k):
+    path, lines = _make(tmp_path, "c.jsonl")
+    idx = line_index.load(path)
+    splits = idx.splits(k)
+    assert splits[0][0] == 0 and splits[-1][1] == len(lines)
+    assert all(a < b for a, b in splits)
+    assert all(prev[1] == cur[0] for prev, cur in zip(splits, splits[1:]))
+    assert len(splits) <= k
+
+    data = path.read_bytes()
+    ranges = idx.byte_ranges(k)
+    assert len(ranges) == len(splits)
+    for (a, b), (start, end) in zip(splits, ranges):
+        assert data[start:end].decode("utf-8") == "".join(lines[a:b])
+
+
+def test_stale_sidecar_is_rebuilt(tmp_path):
+    path, _ = _make(tmp_path, "c.jsonl")
+    assert line_index.load(path, build=False) is not None
+    path.write_text("uno\ndos\n", encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert line_index.load(path, build=False) is None
+    idx = line_index.load(path)
+    assert idx.offsets.tolist() == [0, 4, 8]
+    assert line_index.load(path, build=False).offsets.tolist() == [0, 4, 8]
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import dedup
+import make_mixed_corpus as mix
+
+
+def _write(path, texts):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, t in enumerate(texts):
+            f.write(json.dumps({"id": str(i), "text": t}, ensure_ascii=False) + "\n")
+
+
+def _setup(tmp_path, monkeypatch, a_texts, b_texts):
+    a, b = tmp_path / "a.jsonl", tmp_path / "b.jsonl"
+    _write(a, a_texts)
+    _write(b, b_texts)
+    monkeypatch.setattr(mix, "SOURCES", [(a, 0.6), (b, 0.4)])
+    monkeypatch.setattr(mix, "OUT_JSONL", tmp_path / "mix.jsonl")
+    monkeypatch.setattr(mix, "WORKERS", 1)
+
+
+def test_empty_source_is_reported(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch, ["hola qué tal"] * 10, ["", "   "])
+    with pytest.raises(ValueError, match="b.jsonl"):
+        mix.main()
+
+
+def test_missing_source_is_reported(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch, ["hola"], ["adiós"])
+    (tmp_path / "b.jsonl").unlink()
+    with pytest.raises(FileNotFoundError, match="b.jsonl"):
+        mix.main()
+
+
+def test_mix_respects_token_shares(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch, ["uno dos tres"] * 300, ["cuatro cinco"] * 300)
+    mix.main()
+    texts = [json.loads(line)["text"] for line in open(tmp_path / "mix.jsonl", encoding="utf-8")]
+    a_tok = 3 * texts.count("uno dos tres")
+    b_tok = 2 * texts.count("cuatro cinco")
+    assert a_tok / (a_tok + b_tok) == pytest.approx(0.6, abs=0.02)
+
+
+def test_dedup_table_sized_per_source(tmp_path, monkeypatch):
+    a_texts = [f"frase número {i % 50}" for i in range(300)]
+    _setup(tmp_path, monkeypatch, a_texts, [f"otra {i}" for i in range(300)])
+    monkeypatch.setattr(mix, "DEDUP", {"a.jsonl": "exact"})
+    sizes = []
+    real = mix.Deduper
+
+    def spy(mode, **kw):
+        d = real(mode, **kw)
+        sizes.append((kw.get("lines"), len(d.seen_keys.table)))
+        return d
+
+    monkeypatch.setattr(mix, "Deduper", spy)
+    mix.main()
+    texts = [json.loads(line)["text"] for line in open(tmp_path / "mix.jsonl", encoding="utf-8")]
+    a_out = [t for t in texts if t.startswith("frase")]
+    assert a_out and len(a_out) == len(set(a_out))
+    assert sizes == [(300, 1 << dedup.MIN_CAPACITY_LOG2)]
@@ -0,0 +1,22 @@
+import re
+
+import metrics
+
+
+def test_prometheus_text_has_types_and_fractional_quantiles(tmp_path):
+    m = metrics.StageMetrics("count", str(tmp_path / "metrics.prom"))
+    m.inc("records_in", 5)
+    m.gauge("merge_fan_in", 3)
+    for v in (0.1, 0.2, 0.3):
+        m.observe("llm_latency_seconds", v)
+    text = m._prom_text(m.snapshot())
+
+    types = dict(re.findall(r"^# TYPE (\S+) (\S+)$", text, re.M))
+    assert types["hablai_records_in_total"] == "counter"
+    assert types["hablai_merge_fan_in"] == "gauge"
+    assert types["hablai_llm_latency_seconds"] == "summary"
+    assert set(re.findall(r'quantile="([^"]+)"', text)) == {"0.5", "0.9", "0.99"}
+    assert 'hablai_llm_latency_seconds_count{stage="count"} 3' in text
+    # у каждого сэмпла есть TYPE своего семейства
+    for name in re.findall(r"^(hablai_\w+?)(?:_sum|_count)?\{", text, re.M):
+        assert name in types
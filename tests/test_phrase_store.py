@@ -0,0 +1,51 @@
+import json
+import random
+
+import pytest
+
+import phrase_store
+from phrase_store import PhraseStore, build, phrase_key
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(phrase_store, "SCAN_LIMIT", 8)
+    monkeypatch.setattr(phrase_store, "MAX_K", 5)
+    rng = random.Random(1)
+    words = ["de", "dé", "día", "dónde", "me", "puedes", "ayudar", "¿qué", "pasa", "niño"]
+    src = tmp_path / "index.jsonl"
+    with open(src, "w", encoding="utf-8") as f:
+        for _ in range(400):
+            phrase = " ".join(rng.choice(words) for _ in range(rng.randint(2, 4)))
+            f.write(json.dumps({"phrase": phrase, "freq_phrase": rng.randint(1, 10_000)},
+                               ensure_ascii=False) + "\n")
+    build(src, tmp_path / "store")
+    return PhraseStore(tmp_path / "store"), src
+
+
+def _brute_prefix(src, text, k):
+    key = phrase_store.prefix_key(text)
+    recs = [json.loads(line) for line in open(src, encoding="utf-8")]
+    freqs = sorted((r["freq_phrase"] for r in recs if phrase_key(r["phrase"]).startswith(key)),
+                   reverse=True)
+    return freqs[:k]
+
+
+@pytest.mark.parametrize("text", ["", "d", "dé", "¿", "me ", "me pue", "niño pasa"])
+def test_prefix_matches_brute_force(store, text):
+    st, src = store
+    got = [r["freq_phrase"] for r in st.prefix(text, 5)]
+    assert got == _brute_prefix(src, text, 5)
+
+
+def test_heavy_prefixes_are_precomputed(store):
+    st, _ = store
+    assert st.scan_limit == 8
+    assert len(st.prefixes) > 1 and st.prefixes[0] == b""
+
+
+@pytest.mark.parametrize("k", [0, -1, 6])
+def test_query_rejects_k_out_of_range(store, k):
+    st, _ = store
+    with pytest.raises(ValueError):
+        st.query("prefix", "d", k)
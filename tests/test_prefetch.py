@@ -0,0 +1,123 @@
+import gzip
+import multiprocessing as mp
+import threading
+
+import pytest
+
+import corpus_io
+import prefetch
+from prefetch import PrefetchReader, background, split_lines
+
+
+def _write(path, data: bytes):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "wb") as f:
+        f.write(data)
+
+
+def _read_all(reader):
+    return [line for batch in reader for line in batch]
+
+
+@pytest.fixture(params=[False, True], ids=["threaded", "inline"])
+def inline(request, monkeypatch):
+    monkeypatch.setattr(prefetch, "INLINE", request.param)
+    return request.param
+
+
+def test_split_lines():
+    assert split_lines(b"a\nb\n") == [b"a", b"b"]
+    assert split_lines(b"a\n\nb") == [b"a", b"", b"b"]
+    assert split_lines(b"") == []
+
+
+@pytest.mark.parametrize("name", ["t.jsonl", "t.jsonl.gz"])
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64, 1 << 20])
+def test_blocks_cut_mid_line(tmp_path, inline, name, block_size):
+    lines = [f"line {i} " + "x" * (i % 5) for i in range(50)]
+    path = tmp_path / name
+    _write(path, ("\n".join(lines)).encode())  # последняя строка без \n
+    with PrefetchReader(path, block_size=block_size) as reader:
+        got = _read_all(reader)
+        assert reader.lines == len(lines)
+    assert got == [line.encode() for line in lines]
+
+
+def test_line_limit(tmp_path, inline, monkeypatch):
+    path = tmp_path / "t.jsonl"
+    _write(path, b"".join(b"%d\n" % i for i in range(100)))
+    monkeypatch.setattr(corpus_io, "LINE_LIMIT", 37)
+    with PrefetchReader(path, block_size=16) as reader:
+        assert _read_all(reader) == [b"%d" % i for i in range(37)]
+        assert reader.lines == 37
+    with PrefetchReader(path, block_size=16, respect_limit=False) as reader:
+        assert len(_read_all(reader)) == 100
+        assert reader.lines == 100
+
+
+def test_line_limit_with_unterminated_tail(tmp_path, monkeypatch):
+    path = tmp_path / "t.jsonl"
+    _write(path, b"a\nb\nc")
+    monkeypatch.setattr(corpus_io, "LINE_LIMIT", 2)
+    with PrefetchReader(path) as reader:
+        assert _read_all(reader) == [b"a", b"b"]
+    monkeypatch.setattr(corpus_io, "LINE_LIMIT", 3)
+    with PrefetchReader(path) as reader:
+        assert _read_all(reader) == [b"a", b"b", b"c"]
+
+
+def _failing_decode(block):
+    if b"bad" in block:
+        raise ValueError("cannot decode")
+    return split_lines(block)
+
+
+def test_decode_error_reaches_consumer(tmp_path, inline):
+    path = tmp_path / "t.jsonl"
+    _write(path, b"ok\nok\nbad\nok\n")
+    with PrefetchReader(path, _failing_decode, block_size=3) as reader:
+        with pytest.raises(ValueError, match="cannot decode"):
+            _read_all(reader)
+
+
+def test_pool_decode_error_reaches_consumer(tmp_path):
+    path = tmp_path / "t.jsonl"
+    _write(path, b"ok\nok\nbad\nok\n")
+    with mp.get_context("fork").Pool(2) as pool:
+        with PrefetchReader(path, split_lines, pool, block_size=3) as reader:
+            assert _read_all(reader) == [b"ok", b"ok", b"bad", b"ok"]
+        with PrefetchReader(path, _failing_decode, pool, block_size=3) as reader:
+            with pytest.raises(ValueError, match="cannot decode"):
+                _read_all(reader)
+
+
+def test_background_propagates_errors(inline):
+    def gen():
+        yield 1
+        yield 2
+        raise KeyError("boom")
+
+    got = []
+    with pytest.raises(KeyError):
+        for x in background(gen(), depth=1):
+            got.append(x)
+    assert got == [1, 2]
+
+
+def _prefetch_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("prefetch")]
+
+
+def test_close_does_not_leave_blocked_thread(tmp_path):
+    path = tmp_path / "t.jsonl"
+    _write(path, b"".join(b"%d\n" % i for i in range(10_000)))
+    with PrefetchReader(path, block_size=8, depth=1) as reader:
+        for batch in reader:
+            break
+    assert batch[0] == b"0"
+    assert not _prefetch_threads()
+
+    for x in background(iter(range(10_000)), depth=1):
+        break
+    assert x == 0
+    assert not _prefetch_threads()
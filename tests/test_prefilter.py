@@ -0,0 +1,17 @@
+from prefilter_phrases import simple_prefilter
+
+
+def _keep(phrase):
+    rec = {"phrase": phrase}
+    return simple_prefilter(rec), rec["phrase"]
+
+
+def test_punctuation_is_not_counted_as_words():
+    # 5 слов + пунктуация: в режиме drop пунктуация не раздувает длину
+    assert _keep("¡oye, ¿cómo estás, amigo mío?!") == (True, "oye, ¿cómo estás, amigo mío")
+
+
+def test_length_and_noise_rules():
+    assert _keep("hola")[0] is False
+    assert _keep("de la que")[0] is False
+    assert _keep("TODO EN MAYÚSCULAS")[0] is False
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+import prepare_opensubs_jsonl as prep
+
+
+def _corpus(path):
+    rng = random.Random(7)
+    words = ["hola", "¿qué", "tal?", "señor", "niño", "", "  "]
+    seps = [b"\n", b"\r\n", b"\r", b"\n\n", b"\r\xff\n", b"\r\xc3\n", b"\xff\n"]
+    parts = []
+    for _ in range(3000):
+        parts.append(" ".join(rng.choice(words) for _ in range(rng.randint(0, 4))).encode("utf-8"))
+        parts.append(rng.choice(seps))
+    parts.append(b"sin salto final")
+    path.write_bytes(b"".join(parts))
+
+
+def _run(monkeypatch, tmp_path, name, workers):
+    out = tmp_path / name
+    monkeypatch.setattr(prep, "OUTPUT_JSONL", out)
+    monkeypatch.setattr(prep, "WORKERS", workers)
+    prep.main()
+    return out.read_bytes()
+
+
+@pytest.mark.parametrize("chunk_bytes", [97, 1024, 1 << 20])
+def test_parallel_matches_sequential(tmp_path, monkeypatch, chunk_bytes):
+    src = tmp_path / "es.txt"
+    _corpus(src)
+    monkeypatch.setattr(prep, "INPUT_TXT", src)
+    monkeypatch.setattr(prep, "CHUNK_BYTES", chunk_bytes)
+    assert _run(monkeypatch, tmp_path, "par.jsonl", 2) == _run(monkeypatch, tmp_path, "seq.jsonl", 1)
+
+
+def test_count_lines_matches_text_mode():
+    for data in [b"a\r\xff\nb\n", b"a\r\xc3\xb1\n", b"\r\r\n\n", b"x\r\xff\xfe\r\n"]:
+        text = data.decode("utf-8", errors="ignore")
+        expected = len(text.replace("\r\n", "\n").replace("\r", "\n").split("\n")) - 1
+        assert prep.count_lines(data) == expected
@@ -0,0 +1,72 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+import run_pipeline
+
+
+def test_import_does_not_pull_numpy():
+    code = "import sys, run_pipeline; print('numpy' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=run_pipeline.SCRIPTS_DIR,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "False"
+
+
+def test_instrumentation_is_not_fingerprinted():
+    for stage in run_pipeline.STAGES:
+        mods = {m.name for m in run_pipeline.local_imports(run_pipeline.SCRIPTS_DIR / stage.script)}
+        assert stage.script in mods
+        assert not mods & run_pipeline.NOT_FINGERPRINTED
+
+
+def test_independent_cpu_bound_stages_are_serialized(tmp_path, monkeypatch):
+    stages = [s for s in run_pipeline.STAGES if s.name in ("prepare_opensubs", "dump_c4")]
+    assert all(s.cpu_bound for s in stages)
+    running = []
+    overlap = []
+
+    def fake_run(stage):
+        running.append(stage.name)
+        overlap.append(len(running))
+        time.sleep(0.05)
+        running.remove(stage.name)
+        return 0.05
+
+    monkeypatch.setattr(run_pipeline, "STAGES", stages)
+    monkeypatch.setattr(run_pipeline, "STATE_FILE", tmp_path / "state.json")
+    monkeypatch.setattr(run_pipeline, "run_stage", fake_run)
+    monkeypatch.setattr(sys, "argv", ["run_pipeline.py", "-j", "2"])
+    monkeypatch.chdir(tmp_path)
+    run_pipeline.main()
+    assert overlap == [1, 1]
+
+
+def test_fused_build_index_tracks_prefilter_output(tmp_path, monkeypatch):
+    stage = next(s for s in run_pipeline.STAGES if s.name == "build_index")
+    src = (run_pipeline.SCRIPTS_DIR / stage.script).read_text(encoding="utf-8")
+    assert "\nFUSED_PREFILTER = False\n" in src
+    (tmp_path / stage.script).write_text(
+        src.replace("\nFUSED_PREFILTER = False\n", "\nFUSED_PREFILTER = True\n"), encoding="utf-8")
+    (tmp_path / "prefilter_phrases.py").write_bytes(
+        (run_pipeline.SCRIPTS_DIR / "prefilter_phrases.py").read_bytes())
+
+    prefilter = next(s for s in run_pipeline.STAGES if s.name == "prefilter")
+    unfused = run_pipeline.stage_paths(stage, "outputs")
+    monkeypatch.setattr(run_pipeline, "SCRIPTS_DIR", tmp_path)
+    fused = run_pipeline.stage_paths(stage, "outputs")
+    assert fused == run_pipeline.stage_paths(prefilter, "outputs")
+    assert fused != unfused
+
+
+def test_unschedulable_stage_fails_instead_of_spinning(tmp_path, monkeypatch):
+    orphan = run_pipeline.Stage("orphan", "prefilter_phrases.py", deps=["ghost"])
+    monkeypatch.setattr(run_pipeline, "STAGES", [orphan])
+    monkeypatch.setattr(run_pipeline, "STATE_FILE", tmp_path / "state.json")
+    monkeypatch.setattr(run_pipeline, "run_stage", lambda stage: pytest.fail("must not run"))
+    monkeypatch.setattr(sys, "argv", ["run_pipeline.py"])
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit) as e:
+        run_pipeline.main()
+    assert e.value.code == 1
@@ -0,0 +1,122 @@
+import json
+import random
+import zlib
+
+import pytest
+
+import build_phrase_index as bpi
+import count_ngrams_external as cne
+import filter_phrases_llm as llm
+import shards
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines(keepends=True)
+
+
+def _artifact_lines(path):
+    """Строки артефакта в любой раскладке (шарды подряд)."""
+    return [line for part in shards.parts(path) for line in _lines(part)]
+
+
+def test_shard_of_is_crc32():
+    assert shards.shard_of("señor", 8) == zlib.crc32("señor".encode("utf-8")) % 8
+    assert shards.shard_path("a/freq.jsonl.zst", 3, 8).name == "freq.003-of-008.jsonl.zst"
+
+
+def test_sharded_writer_routes_and_keeps_order(tmp_path):
+    keys = sorted(f"k{i}" for i in range(200))
+    out = tmp_path / "t.jsonl"
+    out.write_text("stale single file\n")
+    with shards.ShardedWriter(out, 4) as w:
+        for k in keys:
+            w.write(k, json.dumps({"text": k}) + "\n")
+
+    assert not out.exists()  # другая раскладка удаляется
+    meta = shards.read_manifest(out)
+    parts = shards.parts(out)
+    assert len(parts) == 4 and sum(meta["records"]) == len(keys)
+    for i, part in enumerate(parts):
+        texts = [json.loads(line)["text"] for line in _lines(part)]
+        assert texts == sorted(texts)
+        assert all(shards.shard_of(t, 4) == i for t in texts)
+        assert len(texts) == meta["records"][i]
+
+    shards.clear(out)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sharded_writer_error_leaves_no_manifest(tmp_path):
+    out = tmp_path / "t.jsonl"
+    with pytest.raises(RuntimeError):
+        with shards.ShardedWriter(out, 2) as w:
+            w.write("a", "{}\n")
+            raise RuntimeError("boom")
+    assert shards.read_manifest(out) is None
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    rng = random.Random(11)
+    words = ["hola", "qué", "tal", "señor", "niño", "dónde", "está", "vamos", "aquí", "ya"]
+    src = tmp_path / "mix.jsonl"
+    with open(src, "w", encoding="utf-8") as f:
+        for i in range(600):
+            text = " ".join(rng.choice(words[:rng.randint(3, 10)]) for _ in range(rng.randint(3, 9)))
+            f.write(json.dumps({"id": i, "text": text}, ensure_ascii=False) + "\n")
+    monkeypatch.setattr(cne, "INPUT_JSONL", src)
+    monkeypatch.setattr(cne, "BATCH_SIZE", 100)
+    monkeypatch.setattr(cne, "BATCH_MIN_5", 1)
+    monkeypatch.setattr(cne, "GLOBAL_MIN_5", 2)
+    monkeypatch.setattr(bpi, "F_MIN", 1)
+    monkeypatch.setattr(bpi, "WORKERS", 2)
+
+    def run(n):
+        d = tmp_path / f"p{n}"
+        d.mkdir()
+        monkeypatch.setattr(cne, "SHARDS", n)
+        for const in ("OUTPUT_UNI", "OUTPUT_NGRAMS_2_4", "OUTPUT_NGRAMS_5"):
+            monkeypatch.setattr(cne, const, d / getattr(cne, const).name)
+        cne.process()
+        monkeypatch.setattr(bpi, "UNIGRAMS", cne.OUTPUT_UNI)
+        monkeypatch.setattr(bpi, "NGRAMS_2_4", cne.OUTPUT_NGRAMS_2_4)
+        monkeypatch.setattr(bpi, "NGRAMS_5", cne.OUTPUT_NGRAMS_5)
+        monkeypatch.setattr(bpi, "PHRASE_INDEX", d / "phrase_index.jsonl")
+        bpi.main()
+        return d
+
+    return run
+
+
+def test_sharded_outputs_hold_the_same_lines(corpus):
+    single, sharded = corpus(1), corpus(4)
+    for name in ("freq_unigrams.jsonl", "freq_ngrams_2_4.jsonl", "freq_ngrams_5.jsonl"):
+        one = _lines(single / name)
+        assert one and one == sorted(one, key=lambda line: json.loads(line)["text"])
+        parts = shards.parts(sharded / name)
+        assert len(parts) == 4
+        for i, part in enumerate(parts):
+            texts = [json.loads(line)["text"] for line in _lines(part)]
+            assert texts == sorted(texts)
+            assert all(shards.shard_of(t, 4) == i for t in texts)
+        assert sorted(_artifact_lines(sharded / name)) == sorted(one)
+
+    index_one = _lines(single / "phrase_index.jsonl")
+    assert index_one
+    assert sorted(_artifact_lines(sharded / "phrase_index.jsonl")) == sorted(index_one)
+
+
+def test_llm_filter_resume_across_shards(tmp_path, monkeypatch):
+    src = tmp_path / "index.jsonl"
+    with shards.ShardedWriter(src, 3) as w:
+        for i in range(50):
+            key = f"frase {i:02d}"
+            w.write(key, json.dumps({"phrase": key, "freq_phrase": i}) + "\n")
+    monkeypatch.setattr(llm, "PHRASE_INDEX", src)
+
+    full = list(llm.iter_input(-1))
+    assert [n for n, _ in full] == list(range(50))
+    assert [line for _, line in full] == _artifact_lines(src)
+    for resume_from in range(-1, 51):
+        assert list(llm.iter_input(resume_from)) == full[resume_from + 1:]